@@ -33,6 +33,7 @@ from src import telegram
 from src import discord
 
 from src.smartnodes import SmartNodeList
+from src.rpcstream import NodeListStream
 
 from smartcash.rpc import RPCConfig
 from smartcash.rewardlist import SNRewardList
@@ -122,11 +123,28 @@ def main(argv):
     except:
         pass
 
+    try:
+        botdb.userCacheSize = int(config.get('optional','usercache'))
+    except:
+        pass
+
     githubUser = config.get('general','githubuser')
     githubPassword = config.get('general','githubpassword')
 
     # Create the smartnode list
-    nodeList = SmartNodeList(nodedb, rpcConfig)
+    nodeList = SmartNodeList(nodedb, rpcConfig, directory + '/nodelist.snapshot',
+                             NodeListStream(rpcUrl, rpcPort, rpcUser, rpcPassword, rpcTimeout))
+    nodeList.metricsPath = directory + '/metrics.json'
+
+    try:
+        nodeList.maxStaleness = int(config.get('optional','maxstaleness'))
+    except:
+        pass
+
+    try:
+        nodeList.notifyPort = int(config.get('optional','blocknotify'))
+    except:
+        pass
 
     # Create the smartnode reward list
     rewardList = SNRewardList(directory + '/rewards.db', rpcConfig)
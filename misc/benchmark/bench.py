@@ -0,0 +1,186 @@
+##
+# Benchmark suite for the nodelist update cycle.
+#
+# Runs SmartNodeList.update() against a synthetic network or a recording
+# (see replay.py) with a temporary node database and reports per list size:
+#
+#   initial   duration of the first cycle which adds all nodes and of the
+#             cycle which assigns the resolved collateral heights
+#   cycle     mean/p95/max duration of the following cycles
+#   lock      mean/max time the list lock was held per cycle
+#   peak      peak memory allocated during one cycle (tracemalloc)
+#   info      duration of rendering the /info command
+#   lookup    duration of rendering a /lookup of 10 nodes
+#
+# Usage: python3 bench.py [--cycles N] [--churn F] [--replay FILE] [nodes ...]
+#
+# Without nodes the list gets measured with 5k, 20k, 50k and 200k nodes.
+##
+
+import os
+import sys
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '../..'))
+
+from src.database import NodeDatabase
+from src.smartnodes import SmartNodeList
+from src.commandhandler import common
+from src.commandhandler import node
+
+from replay import ReplayRPC, attach
+from synthetic import SyntheticNetwork
+
+class BenchBot(object):
+
+    def __init__(self, nodeList):
+        self.nodeList = nodeList
+        self.messenger = 'telegram'
+        self.aberration = 0
+
+######
+# Record the time between acquire and release of the list lock
+######
+def instrumentLock(nodeList):
+
+    holds = []
+    acquired = []
+
+    acquire = nodeList.acquire
+    release = nodeList.release
+
+    def timedAcquire():
+        acquire()
+        acquired.append(time.perf_counter())
+
+    def timedRelease():
+        holds.append(time.perf_counter() - acquired.pop())
+        release()
+
+    nodeList.acquire = timedAcquire
+    nodeList.release = timedRelease
+
+    return holds
+
+def percentile(values, q):
+
+    values = sorted(values)
+
+    return values[int(q / 100.0 * (len(values) - 1))] if len(values) else 0
+
+def timed(call, repeat = 1):
+
+    start = time.perf_counter()
+
+    for i in range(repeat):
+        call()
+
+    return (time.perf_counter() - start) / repeat
+
+def waitForCollaterals(nodeList, timeout = 600):
+
+    start = time.time()
+
+    while nodeList.collaterals.pendingCount() and (time.time() - start) < timeout:
+        time.sleep(0.1)
+
+def run(label, rpc, cycles, step):
+
+    directory = tempfile.mkdtemp(prefix='nodebench')
+
+    try:
+
+        nodeList = SmartNodeList(NodeDatabase(os.path.join(directory, 'nodes.db')), None)
+        attach(nodeList, rpc)
+
+        holds = instrumentLock(nodeList)
+
+        initial = timed(nodeList.update)
+        waitForCollaterals(nodeList)
+
+        step()
+        resolve = timed(nodeList.update)
+
+        durations = []
+        lockHolds = []
+
+        for i in range(cycles):
+
+            step()
+
+            del holds[:]
+            durations.append(timed(nodeList.update))
+            lockHolds.append(sum(holds))
+
+        step()
+
+        tracemalloc.start()
+        nodeList.update()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        bot = BenchBot(nodeList)
+
+        with nodeList.snapshot() as state:
+            ips = [ x.ip for x in list(state.nodes.values())[:10] ]
+
+        info = timed(lambda: common.info(bot, None), 10)
+        lookup = timed(lambda: node.lookup(bot, 0, ips), 10)
+
+        nodeList.rpcPool.shutdown()
+        nodeList.collaterals.stop()
+        nodeList.writer.stop()
+
+    finally:
+        shutil.rmtree(directory)
+
+    print("{:>10} {:>9.3f} {:>9.3f} {:>9.3f} {:>9.3f} {:>9.3f} {:>9.3f} {:>9.3f} {:>9.1f} {:>9.2f} {:>9.2f}".format(label,
+                                                       initial,
+                                                       resolve,
+                                                       sum(durations) / len(durations),
+                                                       percentile(durations, 95),
+                                                       max(durations),
+                                                       sum(lockHolds) / len(lockHolds),
+                                                       max(lockHolds),
+                                                       peak / 1024 / 1024,
+                                                       info * 1000,
+                                                       lookup * 1000))
+
+def main(argv):
+
+    parser = argparse.ArgumentParser(description="Nodelist update cycle benchmark")
+    parser.add_argument('nodes', type=int, nargs='*', default=[5000, 20000, 50000, 200000])
+    parser.add_argument('--cycles', type=int, default=10, help="Measured cycles after the initial ones")
+    parser.add_argument('--churn', type=float, default=0.02, help="Share of the nodes changed per cycle")
+    parser.add_argument('--turnover', type=float, default=0.0005, help="Share of the nodes replaced per cycle")
+    parser.add_argument('--replay', help="Use the recording instead of synthetic lists")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.ERROR)
+
+    print("{:>10} {:>9} {:>9} {:>9} {:>9} {:>9} {:>9} {:>9} {:>9} {:>9} {:>9}".format("Nodes",
+                                                   "Init [s]", "Res. [s]", "Mean [s]", "P95 [s]", "Max [s]",
+                                                   "Lock [s]", "LMax [s]", "Peak [MB]",
+                                                   "Info [ms]", "Look [ms]"))
+
+    if args.replay:
+
+        rpc = ReplayRPC.load(args.replay)
+        # The initial, the resolve and the memory cycle come on top
+        cycles = max(1, rpc.recorded('smartnode', ['list', 'full']) - 3)
+
+        run(os.path.basename(args.replay), rpc, cycles, lambda: None)
+
+    else:
+
+        for count in args.nodes:
+            network = SyntheticNetwork(count, churn = args.churn, turnover = args.turnover)
+            run(count, network, args.cycles, network.step)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,140 @@
+##
+# Compares the memory usage of the nodelist with the previous dict based
+# layout of SmartNode/Transaction against the current compact layout with
+# __slots__, raw hashes and interned values.
+#
+# Usage: python3 memory.py [count] [count] ...
+#
+# Without arguments the list gets measured with 10k and 100k nodes.
+##
+
+import os
+import sys
+import random
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '../..'))
+
+from src.smartnodes import *
+
+class LegacyTransaction(object):
+
+    def __init__(self, txhash, txindex, block):
+        self.hash = txhash
+        self.index = txindex
+        self.block = block
+
+    def __eq__(self, other):
+        return self.hash == other.hash and\
+                self.index == other.index
+
+    def __hash__(self):
+        return hash((self.hash,self.index))
+
+    @classmethod
+    def fromRaw(cls, s):
+
+        if transactionRawCheck.match(s):
+            parts = s[10:-1].split(', ')
+            return cls(parts[0], int(parts[1]), -1)
+
+class LegacySmartNode(object):
+
+    def __init__(self, **kwargs):
+
+        self.collateral = kwargs['collateral']
+        self.payee = str(kwargs['payee'])
+        self.status = str(kwargs['status'])
+        self.activeSeconds = int(kwargs['active_seconds'])
+        self.lastPaidBlock = int(kwargs['last_paid_block'])
+        self.lastPaidTime = int(kwargs['last_paid_time'])
+        self.lastSeen = int(kwargs['last_seen'])
+        self.protocol = int(kwargs['protocol'])
+        self.rank = int(kwargs['rank'])
+        self.ip = str(kwargs['ip'])
+        self.timeout = int(kwargs['timeout'])
+        self.position = POS_CALCULATING
+
+    @classmethod
+    def fromRaw(cls,collateral, raw):
+
+        data = raw.split()
+
+        return cls(collateral = collateral,
+                   payee = data[PAYEE_INDEX],
+                   status = data[STATUS_INDEX].replace('_','-'),
+                   active_seconds = data[ACTIVE_INDEX],
+                   last_paid_block = data[PAIDBLOCK_INDEX],
+                   last_paid_time = data[PAIDTIME_INDEX],
+                   last_seen = data[SEEN_INDEX],
+                   protocol = data[PROTOCOL_INDEX],
+                   ip = data[IPINDEX_INDEX],
+                   rank = -1,
+                   timeout = -1)
+
+def createRows(count):
+
+    random.seed(count)
+
+    rows = {}
+    payees = []
+
+    for i in range(count):
+
+        txhash = '%064x' % random.getrandbits(256)
+        key = 'COutPoint({}, {})'.format(txhash, random.randrange(3))
+
+        # Some owners run several nodes with the same payee
+        if payees and random.random() < 0.3:
+            payee = random.choice(payees)
+        else:
+            payee = 'S' + ''.join(random.choice('123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz') for x in range(33))
+            payees.append(payee)
+
+        rows[key] = ' '.join(map(str, [random.choice(['ENABLED'] * 8 + ['EXPIRED', 'NEW_START_REQUIRED']),
+                                       random.choice([90028, 90029]),
+                                       payee,
+                                       1530000000 + random.randrange(100000),
+                                       random.randrange(5000000),
+                                       1530000000 + random.randrange(100000),
+                                       random.randrange(1000000),
+                                       '{}.{}.{}.{}:9678'.format(*[random.randrange(256) for x in range(4)])]))
+
+    return rows
+
+def measure(rows, transactionClass, nodeClass):
+
+    tracemalloc.start()
+
+    nodes = {}
+
+    for key, data in rows.items():
+        collateral = transactionClass.fromRaw(key)
+        nodes[collateral] = nodeClass.fromRaw(collateral, data)
+
+    size = tracemalloc.get_traced_memory()[0]
+
+    tracemalloc.stop()
+
+    return size
+
+def main(argv):
+
+    counts = list(map(int, argv)) if len(argv) else [10000, 100000]
+
+    print("{:>10} {:>14} {:>14} {:>8}".format("Nodes", "Legacy [MB]", "Compact [MB]", "Saved"))
+
+    for count in counts:
+
+        rows = createRows(count)
+
+        legacy = measure(rows, LegacyTransaction, LegacySmartNode)
+        compact = measure(rows, Transaction, SmartNode)
+
+        print("{:>10} {:>14.2f} {:>14.2f} {:>7.1f}%".format(count,
+                                                          legacy / 1024 / 1024,
+                                                          compact / 1024 / 1024,
+                                                          100 * (1 - compact / legacy)))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,224 @@
+##
+# Local stand-ins for SmartCashRPC to run the nodelist without a smartcashd.
+#
+# ReplayRPC answers the calls with the responses of a recording. The
+# responses of each call (method + params) get returned in the recorded
+# order, once they are used up the last one gets repeated.
+#
+# Recordings are JSON files written by record(), either from a live
+# smartcashd or from a synthetic network (see synthetic.py):
+#
+#   python3 replay.py record <smart.conf> <output> [cycles] [interval]
+#   python3 replay.py synthetic <nodes> <output> [cycles] [churn]
+#
+# Only the fields used by the bot get recorded for getrawtransaction
+# (blockhash) and getblock (height) to keep the recordings small.
+##
+
+import os
+import sys
+import json
+import time
+import configparser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '../..'))
+
+RECORDING_VERSION = 1
+
+class Response(object):
+
+    __slots__ = ['data', 'error']
+
+    def __init__(self, data = None, error = None):
+        self.data = data
+        self.error = error
+
+def callKey(method, params):
+    return json.dumps([method, params])
+
+class ReplayRPC(object):
+
+    def __init__(self, calls):
+
+        self.responses = {}
+        self.counts = {}
+
+        for method, params, data, error in calls:
+            self.responses.setdefault(callKey(method, params), []).append((data, error))
+
+    @classmethod
+    def load(cls, path):
+
+        with open(path) as f:
+            recording = json.load(f)
+
+        if recording.get('version') != RECORDING_VERSION:
+            raise ValueError("Unsupported recording version {}".format(recording.get('version')))
+
+        return cls(recording['calls'])
+
+    ######
+    # Number of recorded responses of a call
+    ######
+    def recorded(self, method, params):
+        return len(self.responses.get(callKey(method, params), []))
+
+    def call(self, method, params):
+
+        key = callKey(method, params)
+        responses = self.responses.get(key)
+
+        if not responses:
+            return Response(error = "No recorded response for {} {}".format(method, params))
+
+        index = self.counts.get(key, 0)
+        self.counts[key] = index + 1
+
+        data, error = responses[min(index, len(responses) - 1)]
+
+        return Response(data, error)
+
+    def raw(self, method, params):
+        return self.call(method, params)
+
+    def getInfo(self):
+        return self.call('getinfo', [])
+
+    def getSyncStatus(self):
+        return self.call('snsync', ['status'])
+
+    def getSmartNodeList(self, mode):
+        return self.call('smartnode', ['list', mode])
+
+    def getRawTransaction(self, txhash):
+        return self.call('getrawtransaction', [txhash])
+
+    def getBlockByHash(self, blockhash):
+        return self.call('getblock', [blockhash])
+
+######
+# Replace the RPC connections of a SmartNodeList with rpc
+######
+def attach(nodeList, rpc):
+
+    nodeList.rpc = rpc
+    nodeList.threadRPC = lambda: rpc
+    nodeList.collaterals.rpc = lambda: rpc
+
+class Recorder(object):
+
+    def __init__(self, rpc):
+        self.rpc = rpc
+        self.calls = []
+        self.collaterals = set()
+
+    def add(self, method, params, response):
+        self.calls.append([method, params, response.data, response.error])
+        return response
+
+    ######
+    # Record the calls of one update cycle and the collateral lookups of
+    # the nodes which were not in the list before.
+    ######
+    def cycle(self):
+
+        rpc = self.rpc
+
+        self.add('snsync', ['status'], rpc.getSyncStatus())
+        self.add('smartnode', ['protocol'], rpc.raw('smartnode', ['protocol']))
+        self.add('getinfo', [], rpc.getInfo())
+        self.add('getblockcount', [], rpc.raw('getblockcount', []))
+
+        nodes = self.add('smartnode', ['list', 'full'], rpc.getSmartNodeList('full'))
+
+        if nodes.error:
+            return False
+
+        for key in nodes.data:
+
+            txhash = key[10:74]
+
+            if txhash in self.collaterals:
+                continue
+
+            self.collaterals.add(txhash)
+
+            rawTx = rpc.getRawTransaction(txhash)
+
+            if rawTx.error or not 'blockhash' in rawTx.data:
+                self.add('getrawtransaction', [txhash], rawTx)
+                continue
+
+            self.add('getrawtransaction', [txhash], Response({'blockhash' : rawTx.data['blockhash']}))
+
+            block = rpc.getBlockByHash(rawTx.data['blockhash'])
+
+            if block.error or not 'height' in block.data:
+                self.add('getblock', [rawTx.data['blockhash']], block)
+            else:
+                self.add('getblock', [rawTx.data['blockhash']], Response({'height' : block.data['height']}))
+
+        return True
+
+    def save(self, path):
+
+        with open(path, 'w') as f:
+            json.dump({'version' : RECORDING_VERSION, 'calls' : self.calls}, f)
+
+######
+# Record cycles of rpc into path. step gets called between the cycles,
+# with a live daemon it just waits interval seconds.
+######
+def record(rpc, path, cycles, step):
+
+    recorder = Recorder(rpc)
+
+    for i in range(cycles):
+
+        if i:
+            step()
+
+        start = time.time()
+
+        if not recorder.cycle():
+            print("Cycle {} failed".format(i))
+
+        print("Cycle {} recorded in {:.2f}s, {} calls".format(i, time.time() - start, len(recorder.calls)))
+
+    recorder.save(path)
+
+def main(argv):
+
+    if len(argv) < 3 or argv[0] not in ['record', 'synthetic']:
+        sys.exit("Usage: replay.py record <smart.conf> <output> [cycles] [interval]\n"
+                 "       replay.py synthetic <nodes> <output> [cycles] [churn]")
+
+    cycles = int(argv[3]) if len(argv) > 3 else 5
+
+    if argv[0] == 'record':
+
+        from smartcash.rpc import SmartCashRPC, RPCConfig
+
+        config = configparser.ConfigParser()
+        config.read(argv[1])
+
+        rpc = SmartCashRPC(RPCConfig(config.get('rpc', 'username'),
+                                     config.get('rpc', 'password'),
+                                     config.get('rpc', 'url'),
+                                     config.get('rpc', 'port'),
+                                     int(config.get('rpc', 'timeout'))))
+
+        interval = float(argv[4]) if len(argv) > 4 else 60
+
+        record(rpc, argv[2], cycles, lambda: time.sleep(interval))
+
+    else:
+
+        from synthetic import SyntheticNetwork
+
+        network = SyntheticNetwork(int(argv[1]), churn = float(argv[4]) if len(argv) > 4 else 0.02)
+
+        record(network, argv[2], cycles, network.step)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
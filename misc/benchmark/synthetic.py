@@ -0,0 +1,163 @@
+##
+# Synthetic smartnode network for benchmarks.
+#
+# SyntheticNetwork answers the same calls as SmartCashRPC with a generated
+# nodelist. Each step() mines a block and applies the churn of one update
+# cycle to the list:
+#
+#   churn     share of the nodes which get seen again with a new uptime,
+#             a tenth of them changes the status as well
+#   turnover  share of the nodes which leave the network and get replaced
+#             by new ones
+#
+# One node gets paid per block. The generated list is reproducible for the
+# same seed.
+##
+
+import time
+import random
+
+from replay import Response
+
+STATUS_WEIGHTS = ['ENABLED'] * 8 + ['EXPIRED', 'NEW_START_REQUIRED']
+
+PROTOCOLS = [90028, 90029]
+
+BLOCK_TIME = 55
+
+class SyntheticNetwork(object):
+
+    def __init__(self, count, churn = 0.02, turnover = 0.0005, seed = 0):
+
+        self.random = random.Random(seed)
+        self.churn = churn
+        self.turnover = turnover
+
+        self.block = 1000000
+        self.now = int(time.time())
+
+        self.fields = {}
+        self.rows = {}
+        self.heights = {}
+        self.payees = []
+
+        for i in range(count):
+            self.addNode(self.random.choice(STATUS_WEIGHTS), self.block - self.random.randrange(10000, 500000))
+
+    def addNode(self, status, height):
+
+        rand = self.random
+
+        txhash = '%064x' % rand.getrandbits(256)
+        key = 'COutPoint({}, {})'.format(txhash, rand.randrange(3))
+
+        # Some owners run several nodes with the same payee
+        if self.payees and rand.random() < 0.3:
+            payee = rand.choice(self.payees)
+        else:
+            payee = 'S' + ''.join(rand.choice('123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz') for x in range(33))
+            self.payees.append(payee)
+
+        lastPaidBlock = rand.randrange(max(height, self.block - 20000), self.block) if status == 'ENABLED' else 0
+        lastPaidTime = self.now - (self.block - lastPaidBlock) * BLOCK_TIME if lastPaidBlock else 0
+
+        self.heights[txhash] = height
+        self.fields[key] = [status,
+                            rand.choice(PROTOCOLS),
+                            payee,
+                            self.now - rand.randrange(600),
+                            (self.block - height) * BLOCK_TIME,
+                            lastPaidTime,
+                            lastPaidBlock,
+                            '{}.{}.{}.{}:9678'.format(*[rand.randrange(256) for x in range(4)])]
+        self.render(key)
+
+    def removeNode(self, key):
+        self.fields.pop(key)
+        self.rows.pop(key)
+
+    def render(self, key):
+        self.rows[key] = ' '.join(map(str, self.fields[key]))
+
+    def step(self):
+
+        rand = self.random
+
+        self.block += 1
+        self.now = int(time.time())
+
+        keys = list(self.fields)
+
+        # Payout of the new block
+        paid = rand.choice(keys)
+        self.fields[paid][5] = self.now
+        self.fields[paid][6] = self.block
+        self.render(paid)
+
+        for key in rand.sample(keys, int(len(keys) * self.churn)):
+
+            fields = self.fields[key]
+            fields[3] = self.now - rand.randrange(60)
+            fields[4] += BLOCK_TIME
+
+            if rand.random() < 0.1:
+                fields[0] = rand.choice(STATUS_WEIGHTS)
+
+            self.render(key)
+
+        replaced = int(len(keys) * self.turnover)
+
+        for key in rand.sample(keys, replaced):
+            if key != paid:
+                self.removeNode(key)
+
+        for i in range(replaced):
+            self.addNode('PRE_ENABLED', self.block)
+
+    ######
+    # SmartCashRPC calls
+    ######
+
+    def raw(self, method, params):
+
+        if method == 'getblockcount':
+            return Response(self.block)
+
+        if method == 'smartnode' and params == ['protocol']:
+            return Response({'oldProtocol' : PROTOCOLS[0],
+                             'newProtocol' : PROTOCOLS[1],
+                             'enableTime' : 0,
+                             'activeProtocol' : PROTOCOLS[0]})
+
+        return Response(error = "Unsupported call {} {}".format(method, params))
+
+    def getInfo(self):
+        return Response({'blocks' : self.block})
+
+    def getSyncStatus(self):
+        return Response({'IsBlockchainSynced' : True,
+                         'IsSmartnodeListSynced' : True,
+                         'IsWinnersListSynced' : True})
+
+    def getSmartNodeList(self, mode):
+
+        if mode != 'full':
+            return Response(error = "Unsupported list mode {}".format(mode))
+
+        return Response(dict(self.rows))
+
+    def getRawTransaction(self, txhash):
+
+        if not txhash in self.heights:
+            return Response(error = "No such mempool or blockchain transaction")
+
+        return Response({'blockhash' : 'b' + txhash})
+
+    def getBlockByHash(self, blockhash):
+
+        height = self.heights.get(blockhash[1:])
+
+        if height == None:
+            return Response(error = "Block not found")
+
+        return Response({'height' : height})
@@ -4,7 +4,9 @@
 // file COPYING or http://www.opensource.org/licenses/mit-license.php.
 
 #include "transaction.h"
+#include <algorithm>
 #include <iostream>
+#include <string>
 #include <vector>
 
 using namespace std;
@@ -18,7 +20,34 @@ struct CompareLastPaidBlock
     }
 };
 
-int main(){
+// Reads "lastPaidBlock hash index" lines from stdin and prints them
+// sorted the same way as the smartnode payment queue.
+int sortStdin(){
+
+    std::vector<std::pair<int, COutPoint*> > vec;
+
+    int block;
+    std::string hash;
+    unsigned int index;
+
+    while( cin >> block >> hash >> index ){
+        vec.push_back(std::make_pair(block, new COutPoint(uint256S(hash), index)));
+    }
+
+    sort(vec.begin(), vec.end(), CompareLastPaidBlock());
+
+    for( auto entry : vec ){
+        cout << entry.first << " " << entry.second->hash.ToString() << " " << entry.second->n << endl;
+    }
+
+    return 0;
+}
+
+int main(int argc, char *argv[]){
+
+    if( argc > 1 && std::string(argv[1]) == "-" ){
+        return sortStdin();
+    }
 
     cout << "Start memcmp test" << endl;
 
@@ -19,10 +19,10 @@ static int mm(uint8_t * str1, uint8_t * str2, size_t count)
 {
    const unsigned char *s1 = (const unsigned char*)str1;
    const unsigned char *s2 = (const unsigned char*)str2;
-  std::cout << std::endl << "mm ";
+  std::cerr << std::endl << "mm ";
   while (count-- > 0)
     {
-      std::cout << std::to_string(*s1) << " " << std::to_string(*s2) << std::endl;
+      std::cerr << std::to_string(*s1) << " " << std::to_string(*s2) << std::endl;
       if (*s1++ != *s2++)
       return s1[-1] < s2[-1] ? -1 : 1;
     }
@@ -0,0 +1,116 @@
+##
+# Verifies that src.smartnodes.PayoutQueue gives the same payment queue order
+# as the legacy memcmp comparison, as Transaction.__lt__ and as the C++
+# reference in ../c++.
+#
+# Build the reference on linux with:
+#
+#   cd ../c++ && g++ -std=c++11 -DHAVE_ENDIAN_H=1 -DHAVE_BYTESWAP_H=1 \
+#       $(for f in BE16TOH BE32TOH BE64TOH HTOBE16 HTOBE32 HTOBE64 HTOLE16 \
+#           HTOLE32 HTOLE64 LE16TOH LE32TOH LE64TOH BSWAP_16 BSWAP_32 BSWAP_64;\
+#           do echo -DHAVE_DECL_$f=1; done) -o collateral_sort *.cpp
+#
+# Usage: python3 sort_key_test.py [path to the collateral_sort binary] [count]
+##
+
+import os
+import sys
+import random
+import functools
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '../../..'))
+
+from src import util
+from src.smartnodes import Transaction, PayoutQueue
+
+######
+# Entries of the vector are (lastPaidBlock, transaction) tuples
+######
+def legacyCompare(a, b):
+
+    if a[0] != b[0]:
+        return -1 if a[0] < b[0] else 1
+
+    hashA = bytes.fromhex(a[1].hash)
+    hashB = bytes.fromhex(b[1].hash)
+
+    compare = util.memcmp(hashA, hashB, len(hashA))
+
+    if compare == 0:
+        compare = (a[1].index > b[1].index) - (a[1].index < b[1].index)
+
+    return compare
+
+def createVector(count):
+
+    vec = []
+    hashes = []
+    collaterals = set()
+
+    while len(vec) < count:
+
+        # Reuse some hashes to also test the index comparison and create
+        # hashes which only differ in a single byte.
+        if hashes and random.random() < 0.1:
+            txhash = random.choice(hashes)
+        elif hashes and random.random() < 0.1:
+            txhash = bytearray.fromhex(random.choice(hashes))
+            txhash[random.randrange(32)] = random.randrange(256)
+            txhash = txhash.hex()
+        else:
+            txhash = '%064x' % random.getrandbits(256)
+
+        hashes.append(txhash)
+
+        transaction = Transaction(txhash, random.randrange(3), -1)
+
+        # The queue holds each collateral once
+        if transaction in collaterals:
+            continue
+
+        collaterals.add(transaction)
+
+        # Lots of equal blocks like after a restart of the network
+        vec.append((random.choice([0, 0, 1, 2, random.randrange(1000)]), transaction))
+
+    return vec
+
+def formatVector(vec):
+    return [ "{} {} {}".format(x[0], x[1].hash, x[1].index) for x in vec ]
+
+def main(argv):
+
+    binary = argv[0] if len(argv) > 0 else None
+    count = int(argv[1]) if len(argv) > 1 else 5000
+
+    vec = createVector(count)
+
+    queue = PayoutQueue()
+
+    for lastPaidBlock, transaction in vec:
+        queue.update(transaction, lastPaidBlock)
+
+    blocks = { transaction : lastPaidBlock for lastPaidBlock, transaction in vec }
+
+    byQueue = formatVector([ (blocks[x], x) for x in queue ])
+    byOperator = formatVector(sorted(vec))
+    byLegacy = formatVector(sorted(vec, key=functools.cmp_to_key(legacyCompare)))
+
+    print("Queue == legacy memcmp: {}".format(byQueue == byLegacy))
+    print("Queue == __lt__: {}".format(byQueue == byOperator))
+
+    if binary:
+
+        result = subprocess.run([binary, '-'],
+                                input='\n'.join(formatVector(vec)),
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL,
+                                universal_newlines=True)
+
+        byReference = result.stdout.splitlines()
+
+        print("Queue == C++ reference: {}".format(byQueue == byReference))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,152 @@
+##
+# Part of `SmartNodeMonitorBot`
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+##
+
+import time
+import socket
+import logging
+import threading
+
+from src.scheduler import Scheduler
+
+logger = logging.getLogger("blockwatch")
+
+#####
+#
+# Block driven scheduler for the nodelist refresh.
+#
+# The block count gets polled pollInterval seconds after the last check by a
+# fixed delay src.scheduler.Scheduler, which is a cheap call compared to the
+# full list refresh. The refresh runs within the check once a new block
+# arrived or if the last refresh is older than maxStaleness seconds.
+#
+# Optionally a UDP port on localhost can be opened to receive block
+# notifications, e.g. with the daemon's blocknotify option:
+#
+#   blocknotify=echo %s | nc -u -w0 127.0.0.1 <port>
+#
+# Each received datagram triggers an immediate block count check.
+#
+#####
+
+class BlockWatcher(object):
+
+    def __init__(self, blockCount, refresh, pollInterval = 5, maxStaleness = 30, notifyPort = None,
+                 stallTimeout = 300, alertCB = None):
+
+        self.blockCount = blockCount
+        self.refresh = refresh
+        self.pollInterval = pollInterval
+        self.maxStaleness = maxStaleness
+        self.notifyPort = notifyPort
+
+        self.running = False
+        self.scheduler = Scheduler("blockwatch", pollInterval, self.check,
+                                   stallTimeout = stallTimeout, alertCB = alertCB, fixedDelay = True)
+        self.listener = None
+        self.socket = None
+
+        self.lastBlock = None
+        self.lastRefresh = 0
+        self.refreshCount = {'block' : 0, 'stale' : 0}
+
+    def start(self):
+
+        if self.running:
+            raise Exception("BlockWatcher already started!")
+
+        self.running = True
+
+        if self.notifyPort:
+
+            try:
+                self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self.socket.bind(('127.0.0.1', self.notifyPort))
+            except OSError as e:
+                logger.error("Could not open the block notify port {}: {}".format(self.notifyPort, e))
+                self.socket = None
+            else:
+                self.listener = threading.Thread(target=self.listen, name="blocknotify", daemon=True)
+                self.listener.start()
+                logger.info("Listen for block notifications on port {}".format(self.notifyPort))
+
+        self.scheduler.start()
+
+    def stop(self):
+
+        self.running = False
+        self.scheduler.stop()
+
+        if self.socket:
+            self.socket.close()
+
+    ######
+    # Trigger an immediate block check
+    ######
+    def notify(self):
+        self.scheduler.trigger()
+
+    def listen(self):
+
+        while self.running:
+
+            try:
+                data = self.socket.recv(256)
+            except OSError:
+                break
+
+            logger.debug("Block notification {}".format(data.strip()))
+            self.notify()
+
+    def check(self):
+
+        now = time.time()
+        block = self.blockCount()
+
+        if block != None and block != self.lastBlock:
+            reason = 'block'
+        elif (now - self.lastRefresh) >= self.maxStaleness:
+            reason = 'stale'
+        else:
+            return False
+
+        logger.info("Refresh - reason {}, block {}".format(reason, block))
+
+        self.refreshCount[reason] += 1
+        self.lastRefresh = now
+
+        # Remember the block after the refresh so that a failed
+        # refresh gets repeated with the next check.
+        self.refresh()
+        self.lastBlock = block
+
+        return True
+
+    def stats(self):
+
+        stats = self.scheduler.stats()
+        stats['lastRefresh'] = self.lastRefresh
+        stats['lastBlock'] = self.lastBlock
+        stats['refreshs'] = dict(self.refreshCount)
+
+        return stats
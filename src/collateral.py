@@ -0,0 +1,203 @@
+##
+# Part of `SmartNodeMonitorBot`
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+##
+
+
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from smartcash.rpc import SmartCashRPC
+
+logger = logging.getLogger("collateral")
+
+#####
+#
+# Resolves the block heights of collateral transactions in the background.
+#
+# The lookups run in a worker pool with one rpc connection per worker. All
+# resolved heights are kept in a txhash => height cache which gets persisted
+# in the node database so that every collateral gets resolved only once.
+#
+# Failed lookups get retried after retryDelay seconds, doubled with each
+# further failure up to retryMax. Nodes without a known collateral height
+# don't qualify for payouts, so collaterals which failed reportAfter times
+# get reported to the errorCB, at most every reportInterval seconds.
+#
+#####
+
+class CollateralResolver(object):
+
+    def __init__(self, db, rpcConfig, workers = 8, errorCB = None):
+
+        self.db = db
+        self.rpcConfig = rpcConfig
+        self.errorCB = errorCB
+        self.local = threading.local()
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.sem = threading.Lock()
+        self.pending = set()
+        self.unsaved = []
+        self.heights = self.db.getCollateralHeights()
+
+        # txhash => (failed lookups, time of the next try)
+        self.failures = {}
+        self.retryDelay = 60
+        self.retryMax = 3600
+        self.reportAfter = 5
+        self.reportInterval = 3600
+        self.lastReport = 0
+
+        logger.info("Loaded {} collateral heights".format(len(self.heights)))
+
+    def stop(self):
+        self.pool.shutdown(wait=False)
+
+    def rpc(self):
+
+        if not hasattr(self.local, 'rpc'):
+            self.local.rpc = SmartCashRPC(self.rpcConfig)
+
+        return self.local.rpc
+
+    ######
+    # Returns the height of the collateral transaction if it is known already.
+    # If not, a lookup gets scheduled and -1 gets returned. The height will be
+    # available with one of the next calls once the lookup is done.
+    ######
+    def height(self, txhash):
+
+        with self.sem:
+
+            if txhash in self.heights:
+                return self.heights[txhash]
+
+            failure = self.failures.get(txhash)
+
+            if failure and time.time() < failure[1]:
+                return -1
+
+            if not txhash in self.pending:
+                self.pending.add(txhash)
+                self.pool.submit(self.resolve, txhash)
+
+        return -1
+
+    ######
+    # Write the heights resolved since the last call into the database or
+    # into target, e.g. a src.nodewriter.NodeWriter.
+    ######
+    def save(self, target = None):
+
+        with self.sem:
+            unsaved = self.unsaved
+            self.unsaved = []
+
+        if len(unsaved):
+            (target if target else self.db).addCollateralHeights(unsaved)
+
+    def pendingCount(self):
+
+        with self.sem:
+            return len(self.pending)
+
+    def failedCount(self):
+
+        with self.sem:
+            return len(self.failures)
+
+    def resolve(self, txhash):
+
+        height = -1
+
+        try:
+            height = self.fetchHeight(txhash)
+        except Exception as e:
+            logger.error("resolve {}".format(txhash), exc_info=e)
+
+        with self.sem:
+
+            if height > 0:
+                self.heights[txhash] = height
+                self.unsaved.append((txhash, height))
+                self.failures.pop(txhash, None)
+            else:
+                # Failed lookups get scheduled again with the first height
+                # call after the backoff
+                count = self.failures.get(txhash, (0, 0))[0] + 1
+                delay = min(self.retryMax, self.retryDelay * 2 ** (count - 1))
+                self.failures[txhash] = (count, time.time() + delay)
+
+            self.pending.discard(txhash)
+
+        if height <= 0:
+            self.reportFailures()
+
+    ######
+    # Report the collaterals which failed at least reportAfter times
+    ######
+    def reportFailures(self):
+
+        with self.sem:
+
+            failing = [ txhash for txhash, failure in self.failures.items() if failure[0] >= self.reportAfter ]
+
+            if not len(failing) or (time.time() - self.lastReport) < self.reportInterval:
+                return
+
+            self.lastReport = time.time()
+
+        msg = "Collateral height lookups of {} transactions failed {} times or more, " \
+              "their nodes stay unqualified. E.g. {}".format(len(failing), self.reportAfter, failing[0])
+
+        logger.error(msg)
+
+        if self.errorCB:
+            self.errorCB(msg)
+
+    def fetchHeight(self, txhash):
+
+        rpc = self.rpc()
+
+        rawTx = rpc.getRawTransaction(txhash)
+
+        if rawTx.error:
+            logger.error('Could not fetch raw transaction: {}'.format(str(rawTx.error)))
+            return -1
+
+        if not "blockhash" in rawTx.data:
+            logger.error("fetchHeight missing blockhash{}".format(rawTx.data))
+            return -1
+
+        block = rpc.getBlockByHash(rawTx.data['blockhash'])
+
+        if block.error:
+            logger.error('Could not fetch block: {}'.format(str(block.error)))
+            return -1
+
+        if not 'height' in block.data:
+            logger.error("fetchHeight missing height: {}".format(block.data))
+            return -1
+
+        return block.data['height']
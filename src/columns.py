@@ -0,0 +1,272 @@
+##
+# Part of `SmartNodeMonitorBot`
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+##
+
+import copy
+import heapq
+import logging
+import operator
+import itertools
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logger = logging.getLogger("columns")
+
+#####
+#
+# Columnar mirror of the nodelist for network wide statistics.
+#
+# Each column holds one value of every node, the row of a node is the same
+# in all columns. With numpy available the queries run vectorized, without
+# it the columns are stored in arrays of the array module.
+#
+# A NodeColumns object is never modified after it was published with a
+# state, patched() returns a patched copy.
+#
+#####
+
+# name => (array typecode, numpy dtype)
+COLUMNS = {
+    'status' : ('b', 'int8'),
+    'protocol' : ('q', 'int64'),
+    'activeSeconds' : ('q', 'int64'),
+    'lastPaidBlock' : ('q', 'int64'),
+    'lastPaidTime' : ('q', 'int64'),
+    'lastSeen' : ('q', 'int64'),
+    'collateralBlock' : ('q', 'int64'),
+    'position' : ('q', 'int64'),
+}
+
+# Status string => status code. Unknown states get the next free code.
+statusCodes = {'ENABLED' : 0,
+               'PRE-ENABLED' : 1,
+               'EXPIRED' : 2,
+               'NEW-START-REQUIRED' : 3,
+               'UPDATE-REQUIRED' : 4,
+               'POSE-BAN' : 5,
+               'OUTPOINT-SPENT' : 6,
+               'WATCHDOG-EXPIRED' : 7}
+
+def statusCode(status):
+    return statusCodes.setdefault(status, len(statusCodes))
+
+def nodeValues(node):
+    return (statusCode(node.status),
+            node.protocol,
+            node.activeSeconds,
+            node.lastPaidBlock,
+            node.lastPaidTime,
+            node.lastSeen,
+            node.collateral.block,
+            node.position)
+
+class NodeColumns(object):
+
+    def __init__(self, collaterals = None, columns = None, rows = None):
+
+        self.collaterals = collaterals if collaterals != None else []
+
+        if rows == None:
+            rows = { collateral : row for row, collateral in enumerate(self.collaterals) }
+
+        self.rows = rows
+
+        if columns == None:
+            columns = { name : self.createColumn(name, []) for name in COLUMNS }
+
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.collaterals)
+
+    @staticmethod
+    def createColumn(name, values):
+
+        if numpy is not None:
+            return numpy.array(values, dtype=COLUMNS[name][1])
+
+        return array(COLUMNS[name][0], values)
+
+    @classmethod
+    def fromNodes(cls, nodes):
+
+        collaterals = list(nodes.keys())
+        values = list(zip(*map(nodeValues, nodes.values())))
+
+        if not len(values):
+            return cls()
+
+        columns = { name : cls.createColumn(name, values[i]) for i, name in enumerate(COLUMNS) }
+
+        return cls(collaterals, columns)
+
+    ######
+    # Returns a copy of the columns with the rows of the given collaterals
+    # updated. Only valid if no nodes were added or removed since the columns
+    # were built, use fromNodes() otherwise.
+    ######
+    def patched(self, nodes, collaterals):
+
+        columns = { name : copy.copy(column) for name, column in self.columns.items() }
+
+        for collateral in collaterals:
+
+            row = self.rows.get(collateral)
+            node = nodes.get(collateral)
+
+            if row == None or node == None:
+                continue
+
+            for name, value in zip(COLUMNS, nodeValues(node)):
+                columns[name][row] = value
+
+        return NodeColumns(self.collaterals, columns, self.rows)
+
+    ######
+    # Masks
+    #
+    # A mask is a bool per row, numpy arrays if available or lists otherwise.
+    ######
+
+    def compare(self, name, op, value):
+
+        column = self.columns[name]
+
+        if numpy is not None:
+            return op(column, value)
+
+        return [ op(x, value) for x in column ]
+
+    def equal(self, name, value):
+        return self.compare(name, operator.eq, value)
+
+    def atLeast(self, name, value):
+        return self.compare(name, operator.ge, value)
+
+    def below(self, name, value):
+        return self.compare(name, operator.lt, value)
+
+    def statusMask(self, status):
+        return self.equal('status', statusCode(status))
+
+    def confirmedMask(self, lastBlock, minimumConfirmations):
+        # collateralBlock > 0 and (lastBlock - collateralBlock) >= minimumConfirmations
+        return self.combine(self.compare('collateralBlock', operator.gt, 0),
+                            self.compare('collateralBlock', operator.le, lastBlock - minimumConfirmations))
+
+    @staticmethod
+    def combine(*masks):
+
+        if numpy is not None:
+            return numpy.logical_and.reduce(masks)
+
+        return [ all(x) for x in zip(*masks) ]
+
+    ######
+    # Queries
+    ######
+
+    @staticmethod
+    def count(mask):
+
+        if numpy is not None:
+            return int(numpy.count_nonzero(mask))
+
+        return sum(mask)
+
+    def select(self, name, mask = None):
+
+        column = self.columns[name]
+
+        if mask is None:
+            return column
+
+        if numpy is not None:
+            return column[mask]
+
+        return array(column.typecode, itertools.compress(column, mask))
+
+    def collateralsWhere(self, mask):
+
+        if numpy is not None:
+            return [ self.collaterals[row] for row in numpy.flatnonzero(mask) ]
+
+        return list(itertools.compress(self.collaterals, mask))
+
+    ######
+    # Returns the collateral of the first row with the value in the column
+    # or None.
+    ######
+    def find(self, name, value):
+
+        column = self.columns[name]
+
+        if numpy is not None:
+            rows = numpy.flatnonzero(column == value)
+            return self.collaterals[rows[0]] if len(rows) else None
+
+        try:
+            return self.collaterals[column.index(value)]
+        except ValueError:
+            return None
+
+    ######
+    # Returns the k-th largest value (1 based) of the column for the rows
+    # in the mask or None if there are less than k of them.
+    ######
+    def kthLargest(self, name, k, mask = None):
+
+        values = self.select(name, mask)
+
+        if k <= 0 or len(values) < k:
+            return None
+
+        if numpy is not None:
+            return int(numpy.partition(values, len(values) - k)[len(values) - k])
+
+        return heapq.nlargest(k, values)[-1]
+
+    ######
+    # Returns the q-th percentile (0-100) of the column for the rows in the
+    # mask with linear interpolation or None if there are no rows.
+    ######
+    def percentile(self, name, q, mask = None):
+
+        values = self.select(name, mask)
+
+        if not len(values):
+            return None
+
+        if numpy is not None:
+            return float(numpy.percentile(values, q))
+
+        values = sorted(values)
+        rank = (len(values) - 1) * q / 100.0
+        lower = int(rank)
+        upper = min(lower + 1, len(values) - 1)
+
+        return values[lower] + (values[upper] - values[lower]) * (rank - lower)
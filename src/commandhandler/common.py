@@ -77,7 +77,7 @@ def info(bot, update):
 
     response = messages.markdown("<u><b>SmartNode Network<b><u>\n\n",bot.messenger)
 
-    with bot.nodeList as nodeList:
+    with bot.nodeList.snapshot() as nodeList:
 
         if nodeList.synced() and nodeList.enabled():
 
@@ -87,13 +87,14 @@ def info(bot, update):
             preEnabled = nodeList.preEnabled
             expired = nodeList.expired
             newStartRequired = nodeList.newStartRequired
-            qualifiedNormal = nodeList.qualifiedNormal
-            qualifiedUpgrade = nodeList.qualifiedUpgrade
-            upgradeModeDuration = nodeList.remainingUpgradeModeDuration
-            protocolRequirement = nodeList.protocolRequirement()
+            parameters = nodeList.parameters
+            qualifiedNormal = parameters.qualifiedNormal
+            qualifiedUpgrade = parameters.qualifiedUpgrade
+            upgradeModeDuration = parameters.upgradeModeDuration
+            protocolRequirement = parameters.protocolRequirement
             protocolOld = nodeList.count(nodeList.oldProtocol)
             protocolNew = nodeList.count(nodeList.newProtocol)
-            initialWait = nodeList.minimumUptime()
+            initialWait = parameters.minimumUptime
             minPosition = int(enabled * 0.1)
             aberration = bot.aberration
 
@@ -101,16 +102,16 @@ def info(bot, update):
             # should actually not happen.
             top10Seconds = (int((qualifiedNormal * 55) / 0.5) * (1 + bot.aberration))
 
-            topNode = list(filter(lambda x: x.position == minPosition, nodeList.nodes.values()))
+            topNode = nodeList.getNodeByPosition(minPosition)
 
-            if len(topNode) and topNode[0].lastPaidTime:
-                top10FromList = time.time() - topNode[0].lastPaidTime
+            if topNode and topNode.lastPaidTime:
+                top10FromList = time.time() - topNode.lastPaidTime
                 if top10FromList < 1.2 * top10Seconds:
                     top10Seconds = top10FromList
 
             top10Time = util.secondsToText(top10Seconds)
 
-            if upgradeModeDuration:
+            if upgradeModeDuration != None:
                 upgradeModeDuration = util.secondsToText(upgradeModeDuration)
 
             response += messages.networkState(bot.messenger,
@@ -150,7 +151,7 @@ def networkUpdate(bot, ids, added):
     else:
         response += "{} node{} left us!\n\n".format(abs(count),"s" if count < 1 else "")
 
-    with bot.nodeList as nodeList:
+    with bot.nodeList.snapshot() as nodeList:
 
         response += messages.markdown("We have <b>{}<b> created nodes now!\n\n".format(nodeList.count()),bot.messenger)
         response += messages.markdown("<b>{}<b> of them are enabled.".format(nodeList.enabled()), bot.messenger)
@@ -173,6 +174,93 @@ def stats(bot):
     response += "User: {}\n".format(len(bot.database.getUsers()))
     response += "Nodes: {}\n".format(len(bot.database.getAllNodes()))
 
+    cache = bot.database.userCacheStats()
+
+    response += "User cache: {} cached, {} hits, {} misses\n".format(cache['size'], cache['hits'], cache['misses'])
+
+    for name, database in [('Bot', bot.database), ('Nodes', bot.nodeList.db)]:
+        response += databaseStats(bot, name, database.stats())
+
+    refresh = bot.nodeList.schedulerStats()
+
+    if refresh:
+        response += schedulerStats(bot, refresh)
+
+        if refresh['lastRefresh']:
+            response += "Last refresh: {} ago\n".format(util.secondsToText(int(time.time() - refresh['lastRefresh'])))
+
+        response += "Refreshs: {}\n".format(", ".join("{} {}".format(k, v) for k, v in refresh['refreshs'].items()))
+
+    writer = bot.nodeList.writerStats()
+
+    response += schedulerStats(bot, writer['scheduler'])
+    response += "Pending: {}, queued {}, written {}, failures {}\n".format(writer['pending'],
+                                                                         writer['queued'],
+                                                                         writer['written'],
+                                                                         writer['failures'])
+
+    phases = bot.nodeList.phases.stats()
+
+    if len(phases):
+
+        response += messages.markdown("\n<b>Update phases<b>\n", bot.messenger)
+
+        for name, phase in phases.items():
+            response += "{}: avg {:.3f}s, p95 {:.3f}s, max {:.3f}s\n".format(name,
+                                                                          phase['average'],
+                                                                          phase['p95'],
+                                                                          phase['max'])
+
+    lock = bot.nodeList.lockStats()
+
+    response += messages.markdown("\n<b>Nodelist lock<b>\n", bot.messenger)
+
+    if lock['holder']:
+        response += "Held by {} for {:.3f}s\n".format(lock['holder'], lock['held'])
+
+    for site, stats in lock['sites'].items():
+        response += "{}: {}x, wait avg {:.3f}s max {:.3f}s, hold avg {:.3f}s max {:.3f}s, slow {}\n".format(site,
+                                                                                                       stats['acquisitions'],
+                                                                                                       stats['wait']['average'],
+                                                                                                       stats['wait']['max'],
+                                                                                                       stats['hold']['average'],
+                                                                                                       stats['hold']['max'],
+                                                                                                       stats['slowHolds'])
+
+    return response
+
+def databaseStats(bot, name, stats):
+
+    readers = stats['readers']
+    sites = stats['writer']['sites'].values()
+
+    response = messages.markdown("\n<b>{} database<b>\n".format(name), bot.messenger)
+
+    response += "Reads: {}, reader waits {} (max {:.3f}s), readers {}/{}\n".format(readers['reads'],
+                                                                                readers['waits'],
+                                                                                readers['wait']['max'],
+                                                                                readers['created'],
+                                                                                readers['size'])
+    response += "Writes: {}, wait max {:.3f}s, hold max {:.3f}s\n".format(sum(x['acquisitions'] for x in sites),
+                                                                         max([x['wait']['max'] for x in sites] + [0]),
+                                                                         max([x['hold']['max'] for x in sites] + [0]))
+
+    return response
+
+def schedulerStats(bot, stats):
+
+    response = messages.markdown("\n<b>Scheduler {}<b>\n".format(stats['name']), bot.messenger)
+
+    response += "Running: {}\n".format(stats['running'])
+    response += "Interval: {}s{}\n".format(stats['interval'], " after each run" if stats['fixedDelay'] else "")
+    response += "Runs: {}, Errors: {}\n".format(stats['runs'], stats['errors'])
+    response += "Overruns: {}, Skipped: {}\n".format(stats['overruns'], stats['missed'])
+    response += "Restarts: {}\n".format(stats['restarts'])
+    response += "Duration: last {:.3f}s, avg {:.3f}s, p95 {:.3f}s, max {:.3f}s\n".format(stats['last'],
+                                                                                      stats['average'],
+                                                                                      stats['p95'],
+                                                                                      stats['max'])
+
     return response
 
 def payouts(bot, args):
@@ -85,7 +85,7 @@ def nodeAdd(bot, update, args):
         valid = False
 
     else:
-        with bot.nodeList as nodeList:
+        with bot.nodeList.snapshot() as nodeList:
 
             for arg in args:
 
@@ -174,7 +174,7 @@ def nodeUpdate(bot, update, args):
 
     else:
 
-        with bot.nodeList as nodeList:
+        with bot.nodeList.snapshot() as nodeList:
 
             for arg in args:
 
@@ -278,7 +278,7 @@ def nodeRemove(bot, update, args):
 
                 else:
 
-                    with bot.nodeList as nodeList:
+                    with bot.nodeList.snapshot() as nodeList:
 
                         logger.info("remove - valid {}".format(ip))
 
@@ -328,10 +328,10 @@ def detail(bot, update):
 
     else:
 
-        with bot.nodeList as nodeList:
+        with bot.nodeList.snapshot() as nodeList:
 
-            minimumUptime = nodeList.minimumUptime()
-            top10 = nodeList.enabledWithMinProtocol() * 0.1
+            minimumUptime = nodeList.parameters.minimumUptime
+            top10 = nodeList.parameters.top10
 
             for userNode in userNodes:
 
@@ -382,12 +382,12 @@ def nodes(bot, update):
 
     else:
 
-        with bot.nodeList as nodeList:
+        with bot.nodeList.snapshot() as nodeList:
 
             collaterals = list(map(lambda x: x['collateral'],userNodes))
             nodes = nodeList.getNodes(collaterals)
-            minimumUptime = nodeList.minimumUptime()
-            top10 = nodeList.enabledWithMinProtocol() * 0.1
+            minimumUptime = nodeList.parameters.minimumUptime
+            top10 = nodeList.parameters.top10
 
             for smartnode in sorted(nodes, key=lambda x: x.position if x.position > 0 else 100000):
 
@@ -432,7 +432,7 @@ def history(bot, update):
 
     else:
 
-        with bot.nodeList as nodeList:
+        with bot.nodeList.snapshot() as nodeList:
 
             collaterals = list(map(lambda x: x['collateral'],userNodes))
             nodes = nodeList.getNodes(collaterals)
@@ -559,13 +559,13 @@ def top(bot, update, args):
 
         response += "<b>Filter<b> {}%\n\n".format(topPercent)
 
-        with bot.nodeList as nodeList:
+        with bot.nodeList.snapshot() as nodeList:
 
-            topX = nodeList.enabledWithMinProtocol() * (topPercent/100)
+            topX = nodeList.parameters.enabledWithMinProtocol * (topPercent/100)
             collaterals = list(map(lambda x: x['collateral'],userNodes))
             nodes = nodeList.getNodes(collaterals)
             topNodes = list(filter(lambda x: x.position <= topX and x.position > 0, nodes))
-            minimumUptime = nodeList.minimumUptime()
+            minimumUptime = nodeList.parameters.minimumUptime
 
             if len(topNodes):
                 for smartnode in sorted(topNodes, key=lambda x: x.position if x.position > 0 else 100000):
@@ -636,7 +636,7 @@ def lookup(bot, userId, args):
 
     response = messages.markdown("<u><b>Node lookup<b><u>\n\n",bot.messenger)
 
-    with bot.nodeList as nodeList:
+    with bot.nodeList.snapshot() as nodeList:
 
         if nodeList.synced() and nodeList.lastBlock:
 
@@ -705,31 +705,27 @@ def handleNodeUpdate(bot, update, node):
 
     responses = {}
 
-    for userNode in bot.database.getNodes(node.collateral):
+    for subscription in bot.database.getSubscriptions(node.collateral):
 
-        dbUser = bot.database.getUser(userNode['user_id'])
+        if not subscription.userId in responses:
+            responses[subscription.userId] = []
 
-        if dbUser:
+        nodeName = subscription.name
 
-            if not dbUser['id'] in responses:
-                responses[dbUser['id']] = []
+        if update['status'] and subscription.status:
 
-            nodeName = userNode['name']
+            response = messages.statusNotification(bot.messenger,nodeName, node.status)
+            responses[subscription.userId].append(response)
 
-            if update['status'] and dbUser['status_n']:
+        if update['timeout'] and subscription.timeout:
 
-                response = messages.statusNotification(bot.messenger,nodeName, node.status)
-                responses[dbUser['id']].append(response)
-
-            if update['timeout'] and dbUser['timeout_n']:
-
-                if node.timeout != -1:
-                    timeString = util.secondsToText( int(time.time()) - node.lastSeen)
-                    response = messages.panicNotification(bot.messenger, nodeName, timeString)
-                else:
-                    response = messages.relaxNotification(bot.messenger, nodeName)
+            if node.timeout != -1:
+                timeString = util.secondsToText( int(time.time()) - node.lastSeen)
+                response = messages.panicNotification(bot.messenger, nodeName, timeString)
+            else:
+                response = messages.relaxNotification(bot.messenger, nodeName)
 
-                #responses[dbUser['id']].append(response)
+            #responses[subscription.userId].append(response)
 
 
     return responses
@@ -749,7 +745,7 @@ def handleReward(bot, reward, distance):
 
     for payee in payees:
 
-        with bot.nodeList as nodeList:
+        with bot.nodeList.snapshot() as nodeList:
             nodes = nodeList.getNodesByPayee(payee)
 
         if not nodes or not len(nodes):
@@ -771,20 +767,18 @@ def handleReward(bot, reward, distance):
 
             for n in nodes:
 
-                for userNode in bot.database.getNodes(n.collateral):
-
-                    dbUser = bot.database.getUser(userNode['user_id'])
+                for subscription in bot.database.getSubscriptions(n.collateral):
 
-                    if dbUser and dbUser['reward_n']:
+                    if subscription.reward:
 
-                        if not dbUser['id'] in responses:
-                            responses[dbUser['id']] = []
+                        if not subscription.userId in responses:
+                            responses[subscription.userId] = []
 
-                        response = messages.rewardNotification(bot.messenger, userNode['name'], reward.block, reward.amount)
+                        response = messages.rewardNotification(bot.messenger, subscription.name, reward.block, reward.amount)
 
                         if count > 1:
                             response += messages.multiplePayeeWarning(bot.messenger, payee, count)
 
-                        responses[dbUser['id']].append(response)
+                        responses[subscription.userId].append(response)
 
     return responses
@@ -23,33 +23,191 @@
 ##
 
 import logging
-from smartcash.util import ThreadedSQLite
 import threading
 import sqlite3 as sql
+from src.sqlitepool import SQLitePool
+from collections import namedtuple, OrderedDict
 
 logger = logging.getLogger("database")
 
+# A node of a user with the notification settings of the user
+Subscription = namedtuple('Subscription', ['userId', 'name', 'status', 'timeout', 'reward', 'network'])
+
+# Columns of the nodes table => value of the SmartNode
+NODE_COLUMNS = OrderedDict([('collateral_block', lambda node: node.collateral.block),
+                            ('payee', lambda node: node.payee),
+                            ('status', lambda node: node.status),
+                            ('activeseconds', lambda node: node.activeSeconds),
+                            ('last_paid_block', lambda node: node.lastPaidBlock),
+                            ('last_paid_time', lambda node: node.lastPaidTime),
+                            ('last_seen', lambda node: node.lastSeen),
+                            ('protocol', lambda node: node.protocol),
+                            ('ip', lambda node: node.ip),
+                            ('timeout', lambda node: node.timeout)])
+
 #####
 #
 # Wrapper for the user database where all the users
 # and their added nodes are stored.
 #
+# The nodes of the users are mirrored in a subscription index
+# (collateral => tuple of Subscription) which gets loaded once and is kept
+# in sync with the writes. The notifications use it instead of querying
+# the database for each changed node.
+#
+# The users get cached write-through in userCache. With userCacheSize set
+# the least recently used users get evicted once the cache is full.
+#
 #####
 
 class BotDatabase(object):
 
     def __init__(self, dburi):
 
-        self.connection = ThreadedSQLite(dburi)
+        self.connection = SQLitePool(dburi)
 
         if self.isEmpty():
             self.reset()
 
+        self.subscriptionSem = threading.Lock()
+        self.subscriptions = {}
+        self.loadSubscriptions()
+
+        self.userCacheSem = threading.Lock()
+        self.userCache = OrderedDict()
+        self.userCacheSize = None
+        self.userCacheHits = 0
+        self.userCacheMisses = 0
+        # userId => number of writes, a user read from the database gets
+        # only cached if no write happened since the read.
+        self.userGenerations = {}
+
+    def loadSubscriptions(self):
+
+        with self.connection.reader() as db:
+
+            db.cursor.execute("SELECT nodes.collateral, nodes.user_id, nodes.name, users.status_n, users.timeout_n, users.reward_n, users.network_n "
+                              "FROM nodes JOIN users ON users.id = nodes.user_id")
+
+            rows = db.cursor.fetchall()
+
+        subscriptions = {}
+
+        for row in rows:
+            subscription = Subscription(row[1], row[2], row[3], row[4], row[5], row[6])
+            subscriptions[row[0]] = subscriptions.get(row[0], ()) + (subscription,)
+
+        with self.subscriptionSem:
+            self.subscriptions = subscriptions
+
+        logger.info("Loaded {} subscriptions of {} nodes".format(len(rows), len(subscriptions)))
+
+    ######
+    # Returns the subscriptions of the collateral
+    ######
+    def getSubscriptions(self, collateral):
+
+        with self.subscriptionSem:
+            return self.subscriptions.get(str(collateral), ())
+
+    ######
+    # Apply change(subscription) to the subscriptions matching the filter.
+    # The subscription gets dropped if change returns None.
+    ######
+    def changeSubscriptions(self, change, collateral = None, userId = None):
+
+        with self.subscriptionSem:
+
+            collaterals = [collateral] if collateral else list(self.subscriptions.keys())
+
+            for key in collaterals:
+
+                subscriptions = self.subscriptions.get(key, ())
+
+                if userId == None:
+                    changed = tuple(change(x) for x in subscriptions)
+                else:
+                    changed = tuple(change(x) if x.userId == userId else x for x in subscriptions)
+
+                changed = tuple(filter(lambda x: x != None, changed))
+
+                if len(changed):
+                    self.subscriptions[key] = changed
+                else:
+                    self.subscriptions.pop(key, None)
+
+    ######
+    # Add the user to the cache if it was not written since generation
+    ######
+    def cacheUser(self, user, generation):
+
+        with self.userCacheSem:
+
+            if self.userGenerations.get(user['id'], 0) != generation:
+                return
+
+            self.userCache[user['id']] = user
+            self.userCache.move_to_end(user['id'])
+
+            while self.userCacheSize and len(self.userCache) > self.userCacheSize:
+                self.userCache.popitem(last=False)
+
+    ######
+    # Apply the column values to the cached user. Called after each write
+    # of the user.
+    ######
+    def changeCachedUser(self, userId, **values):
+
+        with self.userCacheSem:
+
+            self.userGenerations[userId] = self.userGenerations.get(userId, 0) + 1
+
+            user = self.userCache.get(userId)
+
+            if user:
+                user.update(values)
+
+    ######
+    # Drop the user from the cache. Called after each insert or deletion of
+    # the user.
+    ######
+    def dropCachedUser(self, userId):
+
+        with self.userCacheSem:
+            self.userGenerations[userId] = self.userGenerations.get(userId, 0) + 1
+            self.userCache.pop(userId, None)
+
+    def userCacheStats(self):
+
+        with self.userCacheSem:
+            return {'size' : len(self.userCache),
+                    'limit' : self.userCacheSize,
+                    'hits' : self.userCacheHits,
+                    'misses' : self.userCacheMisses}
+
+    def addSubscription(self, collateral, userId, name):
+
+        user = self.getUser(userId)
+
+        if not user:
+            return
+
+        subscription = Subscription(userId, name, user['status_n'], user['timeout_n'], user['reward_n'], user['network_n'])
+
+        with self.subscriptionSem:
+            self.subscriptions[collateral] = self.subscriptions.get(collateral, ()) + (subscription,)
+
+    ######
+    # Contention statistics of the connections
+    ######
+    def stats(self):
+        return self.connection.stats()
+
     def isEmpty(self):
 
         tables = []
 
-        with self.connection as db:
+        with self.connection.reader() as db:
 
             db.cursor.execute("SELECT name FROM sqlite_master")
 
@@ -74,6 +232,9 @@ class BotDatabase(object):
 
                 user = db.cursor.lastrowid
 
+            # Cached with the next getUser
+            self.dropCachedUser(userId)
+
         else:
 
             user = user['id']
@@ -93,7 +254,9 @@ class BotDatabase(object):
 
                 db.cursor.execute("INSERT INTO nodes( collateral, name, user_id  )  values( ?, ?, ? )", ( collateral, name, user ) )
 
-                return True
+            self.addSubscription(collateral, user, name)
+
+            return True
 
         return False
 
@@ -101,7 +264,7 @@ class BotDatabase(object):
 
         users = []
 
-        with self.connection as db:
+        with self.connection.reader() as db:
             query = "SELECT * FROM users"
 
             if condition:
@@ -112,23 +275,46 @@ class BotDatabase(object):
 
         return users
 
+    ######
+    # Returns the user as dict or None. The dict is shared with the cache
+    # and must not be modified.
+    ######
     def getUser(self, userId):
 
         user = None
 
-        with self.connection as db:
+        with self.userCacheSem:
+
+            user = self.userCache.get(userId)
+
+            if user:
+                self.userCacheHits += 1
+
+                if self.userCacheSize:
+                    self.userCache.move_to_end(userId)
+
+                return user
+
+            self.userCacheMisses += 1
+            generation = self.userGenerations.get(userId, 0)
+
+        with self.connection.reader() as db:
 
             db.cursor.execute("SELECT * FROM users WHERE id=?",[userId])
 
             user = db.cursor.fetchone()
 
+        if user:
+            user = { key : user[key] for key in user.keys() }
+            self.cacheUser(user, generation)
+
         return user
 
     def getAllNodes(self, userId = None):
 
         nodes = []
 
-        with self.connection as db:
+        with self.connection.reader() as db:
 
             if userId:
                 db.cursor.execute("SELECT * FROM nodes WHERE user_id=? ORDER BY name",[userId])
@@ -145,7 +331,7 @@ class BotDatabase(object):
 
         collateral = str(collateral)
 
-        with self.connection as db:
+        with self.connection.reader() as db:
 
             if userId:
                 db.cursor.execute("SELECT * FROM nodes WHERE collateral=? and user_id=?",(str(collateral),userId))
@@ -162,6 +348,8 @@ class BotDatabase(object):
 
             db.cursor.execute("UPDATE users SET name=? WHERE id=?",(name,userId))
 
+        self.changeCachedUser(userId, name = name)
+
     def updateNode(self, collateral, userId, name):
 
         collateral = str(collateral)
@@ -170,47 +358,73 @@ class BotDatabase(object):
 
             db.cursor.execute("UPDATE nodes SET name=? WHERE collateral=? and user_id=?",(name, str(collateral), userId))
 
+        self.changeSubscriptions(lambda x: x._replace(name = name), collateral, userId)
+
     def updateStatusNotification(self, userId, state):
 
         with self.connection as db:
 
             db.cursor.execute("UPDATE users SET status_n = ? WHERE id=?",(state,userId))
 
+        self.changeCachedUser(userId, status_n = state)
+
+        self.changeSubscriptions(lambda x: x._replace(status = state), userId = userId)
+
     def updateTimeoutNotification(self, userId, state):
 
         with self.connection as db:
 
             db.cursor.execute("UPDATE users SET timeout_n = ? WHERE id=?",(state,userId))
 
+        self.changeCachedUser(userId, timeout_n = state)
+
+        self.changeSubscriptions(lambda x: x._replace(timeout = state), userId = userId)
+
     def updateRewardNotification(self, userId, state):
 
         with self.connection as db:
 
             db.cursor.execute("UPDATE users SET reward_n = ? WHERE id=?",(state,userId))
 
+        self.changeCachedUser(userId, reward_n = state)
+
+        self.changeSubscriptions(lambda x: x._replace(reward = state), userId = userId)
+
     def updateNetworkNotification(self, userId, state):
 
         with self.connection as db:
 
             db.cursor.execute("UPDATE users SET network_n = ? WHERE id=?",(state,userId))
 
+        self.changeCachedUser(userId, network_n = state)
+
+        self.changeSubscriptions(lambda x: x._replace(network = state), userId = userId)
+
     def deleteUser(self, userId):
 
         with self.connection as db:
 
             db.cursor.execute("DELETE FROM users WHERE id=?",[userId])
 
+        self.dropCachedUser(userId)
+
+        self.changeSubscriptions(lambda x: None, userId = userId)
+
     def deleteNode(self, collateral, userId):
 
         with self.connection as db:
 
             db.cursor.execute("DELETE FROM nodes WHERE collateral=? and user_id=?",(str(collateral),userId))
 
+        self.changeSubscriptions(lambda x: None, str(collateral), userId)
+
     def deleteNodesForUser(self, userId):
 
         with self.connection as db:
             db.cursor.execute("DELETE FROM nodes WHERE user_id=?",[userId])
 
+        self.changeSubscriptions(lambda x: None, userId = userId)
+
     def deleteNodesWithId(self, collateral):
 
         collateral = str(collateral)
@@ -218,6 +432,9 @@ class BotDatabase(object):
         with self.connection as db:
             db.cursor.execute("DELETE FROM nodes WHERE collateral=?",[str(collateral)])
 
+        with self.subscriptionSem:
+            self.subscriptions.pop(collateral, None)
+
     def reset(self):
 
         sql = 'BEGIN TRANSACTION;\
@@ -256,16 +473,24 @@ class NodeDatabase(object):
 
     def __init__(self, dburi):
 
-        self.connection = ThreadedSQLite(dburi)
+        self.connection = SQLitePool(dburi)
 
         if self.isEmpty():
             self.reset()
 
+        self.createCollateralTable()
+
+    ######
+    # Contention statistics of the connections
+    ######
+    def stats(self):
+        return self.connection.stats()
+
     def isEmpty(self):
 
         tables = []
 
-        with self.connection as db:
+        with self.connection.reader() as db:
 
             db.cursor.execute("SELECT name FROM sqlite_master")
 
@@ -326,7 +551,7 @@ class NodeDatabase(object):
         nodes = []
         rows = '*' if filter == None else ",".join(filter)
 
-        with self.connection as db:
+        with self.connection.reader() as db:
 
             db.cursor.execute("SELECT {} FROM nodes".format(rows))
 
@@ -338,7 +563,7 @@ class NodeDatabase(object):
 
         count = 0
 
-        with self.connection as db:
+        with self.connection.reader() as db:
 
             if where:
                 db.cursor.execute("SELECT COUNT(collateral) FROM nodes WHERE {}".format(where))
@@ -355,7 +580,7 @@ class NodeDatabase(object):
 
         search = "{}:9678".format(ip)
 
-        with self.connection as db:
+        with self.connection.reader() as db:
 
             db.cursor.execute("SELECT * FROM nodes WHERE ip=?",[search])
 
@@ -367,7 +592,7 @@ class NodeDatabase(object):
 
         nodes = None
 
-        with self.connection as db:
+        with self.connection.reader() as db:
 
             db.cursor.execute("SELECT * FROM nodes WHERE payee=?",[payee])
 
@@ -376,42 +601,169 @@ class NodeDatabase(object):
         return nodes if nodes else []
 
     def updateNode(self, collateral, node):
+        self.updateNodes([node])
 
-        if not self.addNode(collateral, node):
+    ######
+    # Apply all inserts, updates and deletions of one nodelist cycle inside
+    # a single transaction.
+    #
+    # nodes - SmartNode objects to insert or update (upsert)
+    # removed - Collaterals of the nodes to delete
+    ######
+    def updateNodes(self, nodes = None, removed = None):
 
-            with self.connection as db:
+        rows = [ self.nodeRow(node) for node in nodes ] if nodes else []
+        removed = [ str(collateral) for collateral in removed ] if removed else []
 
-                query = "UPDATE nodes SET\
-                                collateral_block=?,\
-                                payee=?,\
-                                status=?,\
-                                activeseconds=?,\
-                                last_paid_block=?,\
-                                last_paid_time=?,\
-                                last_seen=?,\
-                                protocol=?,\
-                                ip=?,\
-                                timeout=?\
-                                WHERE collateral=?"
-
-                db.cursor.execute(query, (\
-                                  collateral.block,\
-                                  node.payee,\
-                                  node.status,\
-                                  node.activeSeconds,\
-                                  node.lastPaidBlock,\
-                                  node.lastPaidTime,\
-                                  node.lastSeen,\
-                                  node.protocol,\
-                                  node.ip,
-                                  node.timeout,
-                                  str(collateral)))
+        return self.writeRows(rows, removed)
+
+    ######
+    # Write rows of nodeRow(), deletions of collateral strings, (txhash, height)
+    # tuples and partial updates inside a single transaction.
+    #
+    # updates - (columns, row of nodeRow()) tuples, only the columns get
+    # written. Updates with the same columns get written with one generated
+    # UPDATE statement. If rows of a statement are missing in the table all
+    # its rows get written completely.
+    ######
+    def writeRows(self, rows, removed, heights = None, updates = None):
+
+        removed = [ [collateral] for collateral in removed ]
+        statements = {}
+        indices = { column : index for index, column in enumerate(NODE_COLUMNS) }
+
+        for columns, row in (updates if updates else []):
+
+            columns = tuple(sorted(columns))
+
+            if not columns in statements:
+
+                for column in columns:
+                    if not column in indices:
+                        raise ValueError("Invalid node column {}".format(column))
+
+                statements[columns] = ([], [])
+
+            params, fullRows = statements[columns]
+            params.append([ row[indices[x]] for x in columns ] + [row[-1]])
+            fullRows.append(row)
+
+        if not len(rows) and not len(removed) and not heights and not len(statements):
+            return True
+
+        with self.connection as db:
+
+            try:
+
+                if len(rows):
+                    self.upsertRows(db, rows)
+
+                for columns, (params, fullRows) in statements.items():
+
+                    db.cursor.executemany("UPDATE nodes SET {} WHERE collateral=?".format(", ".join("{}=?".format(x) for x in columns)), params)
+
+                    # Bring back rows which got lost, e.g. by an earlier
+                    # failed write.
+                    if db.cursor.rowcount < len(params):
+                        logger.warning("writeRows - {} rows missing, write them completely".format(len(params) - db.cursor.rowcount))
+                        self.upsertRows(db, fullRows)
+
+                if len(removed):
+                    db.cursor.executemany("DELETE FROM nodes WHERE collateral=?", removed)
+
+                if heights:
+                    db.cursor.executemany("INSERT OR REPLACE INTO collaterals( txhash, height ) values( ?, ? )", heights)
+
+            except Exception as e:
+                logger.error("writeRows failed", exc_info=e)
+                db.cursor.connection.rollback()
+                return False
+
+        return True
+
+    ######
+    # Insert or update the rows of nodeRow() with all columns
+    ######
+    def upsertRows(self, db, rows):
+
+        # Make sure all nodes exist, then update them. Works also
+        # with SQLite versions without native upsert support.
+        db.cursor.executemany("INSERT OR IGNORE INTO nodes(\
+                              collateral_block,\
+                              payee,\
+                              status,\
+                              activeseconds,\
+                              last_paid_block,\
+                              last_paid_time,\
+                              last_seen,\
+                              protocol,\
+                              ip,\
+                              timeout,\
+                              collateral ) \
+                              values( ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ? )", rows)
+
+        db.cursor.executemany("UPDATE nodes SET\
+                              collateral_block=?,\
+                              payee=?,\
+                              status=?,\
+                              activeseconds=?,\
+                              last_paid_block=?,\
+                              last_paid_time=?,\
+                              last_seen=?,\
+                              protocol=?,\
+                              ip=?,\
+                              timeout=?\
+                              WHERE collateral=?", rows)
+
+    ######
+    # Values of all NODE_COLUMNS followed by the collateral
+    ######
+    def nodeRow(self, node):
+        return tuple(value(node) for value in NODE_COLUMNS.values()) + (str(node.collateral),)
 
     def deleteNode(self, collateral):
+        self.updateNodes(removed = [collateral])
+
+    def getCollateralHeights(self):
+
+        heights = {}
+
+        with self.connection.reader() as db:
+
+            db.cursor.execute("SELECT * FROM collaterals")
+
+            for row in db.cursor.fetchall():
+                heights[row['txhash']] = row['height']
+
+        return heights
+
+    def addCollateralHeights(self, heights):
 
         with self.connection as db:
 
-            db.cursor.execute("DELETE FROM nodes WHERE collateral=?",[str(collateral)])
+            db.cursor.executemany("INSERT OR REPLACE INTO collaterals( txhash, height ) values( ?, ? )", heights)
+
+    ######
+    # Persistent txhash => block height cache for the collateral transactions.
+    # Gets created for existing databases and seeded with the known heights.
+    ######
+    def createCollateralTable(self):
+
+        with self.connection as db:
+
+            db.cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='collaterals'")
+
+            if db.cursor.fetchone():
+                return
+
+            db.cursor.execute("CREATE TABLE `collaterals` (\
+                              `txhash` TEXT NOT NULL PRIMARY KEY,\
+                              `height` INTEGER NOT NULL\
+                              )")
+
+            db.cursor.execute("INSERT OR IGNORE INTO collaterals( txhash, height )\
+                              SELECT substr(collateral, 1, 64), collateral_block FROM nodes\
+                              WHERE collateral_block > 0")
 
     def reset(self):
 
@@ -409,7 +409,7 @@ class SmartNodeBotDiscord(object):
                 return
 
             collaterals = list(map(lambda x: x['collateral'],userNodes))
-            nodes = self.nodeList.getNodes(collaterals)
+            nodes = self.nodeList.snapshot().getNodes(collaterals)
             check = self.explorer.balances(nodes)
 
             # Needed cause the balanceChecks dict also gets modified from other
@@ -575,7 +575,7 @@ class SmartNodeBotDiscord(object):
     ######
     def networkCB(self, collaterals, added):
 
-        nodeCount = self.nodeList.count()
+        nodeCount = self.nodeList.snapshot().count()
         asyncio.run_coroutine_threadsafe(self.client.change_presence(game=discord.Game(name='our {} SmartNodes'.format(nodeCount), type=3)), loop=self.client.loop)
 
         response = common.networkUpdate(self, collaterals, added)
@@ -597,12 +597,12 @@ class SmartNodeBotDiscord(object):
         for collateral in collaterals:
 
             # Before chec if a node from anyone got removed and let him know about it.
-            for userNode in self.database.getNodes(collateral):
+            for subscription in self.database.getSubscriptions(collateral):
 
-                member = self.findMember(userNode['user_id'])
+                member = self.findMember(subscription.userId)
 
                 if member:
-                    response = messages.nodeRemovedNotification(self.messenger, userNode['name'])
+                    response = messages.nodeRemovedNotification(self.messenger, subscription.name)
                     asyncio.run_coroutine_threadsafe(self.sendMessage(member, response), loop=self.client.loop)
 
             # Remove all entries containing this node in the db
@@ -41,14 +41,14 @@ class FAQ(object):
 
 def qualified(bot):
 
-    with bot.nodeList as nodeList:
+    with bot.nodeList.snapshot() as nodeList:
 
         if not nodeList.synced() or not nodeList.enabled():
             return messages.notSynced(bot.messenger)
 
-        confirmations = int(nodeList.enabledWithMinProtocol() / 0.5)
-        initialWait = util.secondsToText(nodeList.minimumUptime())
-        protocolRequirement = nodeList.protocolRequirement()
+        confirmations = int(nodeList.parameters.minimumConfirmations)
+        initialWait = util.secondsToText(nodeList.parameters.minimumUptime)
+        protocolRequirement = nodeList.parameters.protocolRequirement
 
         return (
         "Your node has to match the following requirements before it's ready to"
@@ -66,7 +66,7 @@ def qualified(bot):
 
 def position(bot):
 
-    with bot.nodeList as nodeList:
+    with bot.nodeList.snapshot() as nodeList:
 
         if not nodeList.synced() or not nodeList.enabled():
             return messages.notSynced(bot.messenger)
@@ -74,14 +74,14 @@ def position(bot):
 
         nodes = nodeList.count()
         enabled = nodeList.enabled()
-        qualified = nodeList.qualifiedNormal
+        qualified = nodeList.parameters.qualifiedNormal
         unqualified = nodes - qualified
         minPosition = int(enabled * 0.1)
         top10Seconds = (int((qualified * 55) / 0.5) * (1 + bot.aberration))
-        topNode = list(filter(lambda x: x.position == minPosition, nodeList.nodes.values()))
+        topNode = nodeList.getNodeByPosition(minPosition)
 
-        if len(topNode) and topNode[0].lastPaidTime:
-            top10FromList = time.time() - topNode[0].lastPaidTime
+        if topNode and topNode.lastPaidTime:
+            top10FromList = time.time() - topNode.lastPaidTime
             if top10FromList < 1.2 * top10Seconds:
                 top10Seconds = top10FromList
 
@@ -113,12 +113,12 @@ def position(bot):
 
 def collateral(bot):
 
-    with bot.nodeList as nodeList:
+    with bot.nodeList.snapshot() as nodeList:
 
         if not nodeList.synced() or not nodeList.enabled():
             return messages.notSynced(bot.messenger)
 
-        confirmations = int(nodeList.enabledWithMinProtocol() / 0.5)
+        confirmations = int(nodeList.parameters.minimumConfirmations)
         timeString = util.secondsToText(confirmations * 55)
 
         return (
@@ -133,12 +133,12 @@ def collateral(bot):
 
 def initial(bot):
 
-    with bot.nodeList as nodeList:
+    with bot.nodeList.snapshot() as nodeList:
 
         if not nodeList.synced() or not nodeList.enabled():
             return messages.notSynced(bot.messenger)
 
-        initialWait = util.secondsToText(nodeList.minimumUptime())
+        initialWait = util.secondsToText(nodeList.parameters.minimumUptime)
 
         return (
         "When your node shows <b>Initial wait time<b> instead of a position it's"
@@ -153,24 +153,24 @@ def initial(bot):
 
 def rewards(bot):
 
-    with bot.nodeList as nodeList:
+    with bot.nodeList.snapshot() as nodeList:
 
         if not nodeList.synced() or not nodeList.enabled():
             return messages.notSynced(bot.messenger)
 
         enabled = nodeList.enabled()
         minPosition = int(enabled * 0.1)
-        qualified = nodeList.qualifiedNormal
+        qualified = nodeList.parameters.qualifiedNormal
         lastBlock = nodeList.lastBlock
 
         # Fallback if for whatever reason the top node could not filtered which
         # should actually not happen.
         top10Seconds = (int((qualified * 55) / 0.5) * (1 + bot.aberration))
 
-        topNode = list(filter(lambda x: x.position == minPosition, nodeList.nodes.values()))
+        topNode = nodeList.getNodeByPosition(minPosition)
 
-        if len(topNode) and topNode[0].lastPaidTime:
-            top10FromList = time.time() - topNode[0].lastPaidTime
+        if topNode and topNode.lastPaidTime:
+            top10FromList = time.time() - topNode.lastPaidTime
             if top10FromList < 1.2 * top10Seconds:
                 top10Seconds = top10FromList
 
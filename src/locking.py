@@ -0,0 +1,157 @@
+##
+# Part of `SmartNodeMonitorBot`
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+##
+
+import os
+import sys
+import time
+import logging
+import threading
+import traceback
+from collections import OrderedDict
+
+from src.metrics import RollingHistogram
+
+logger = logging.getLogger("locking")
+
+# Functions of the lock protocol which get skipped to find the caller
+LOCK_FUNCTIONS = ['acquire', 'release', '__enter__', '__exit__']
+
+######
+# Returns "module.function" of the first caller outside of the lock protocol
+######
+def callerSite():
+
+    frame = sys._getframe(1)
+
+    while frame.f_back and (frame.f_code.co_filename == __file__ or frame.f_code.co_name in LOCK_FUNCTIONS):
+        frame = frame.f_back
+
+    module = os.path.splitext(os.path.basename(frame.f_code.co_filename))[0]
+
+    return "{}.{}".format(module, frame.f_code.co_name)
+
+class SiteStats(object):
+
+    def __init__(self):
+        self.acquisitions = 0
+        self.slowHolds = 0
+        self.waits = RollingHistogram()
+        self.holds = RollingHistogram()
+
+#####
+#
+# Lock which records the wait and the hold time per caller site.
+#
+# The site is the calling "module.function" if not given explicitly. Holds
+# longer than slowHold seconds get logged with the stack of the holder.
+#
+#####
+
+class InstrumentedLock(object):
+
+    def __init__(self, name, slowHold = 5):
+
+        self.name = name
+        self.slowHold = slowHold
+
+        self.lock = threading.Lock()
+        self.sem = threading.Lock()
+        self.sites = OrderedDict()
+
+        # Site and acquire time of the current holder
+        self.holder = None
+        self.acquired = 0
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.release()
+
+    def acquire(self, site = None):
+
+        if site == None:
+            site = callerSite()
+
+        start = time.perf_counter()
+
+        self.lock.acquire()
+
+        self.acquired = time.perf_counter()
+        self.holder = site
+
+        with self.sem:
+
+            if not site in self.sites:
+                self.sites[site] = SiteStats()
+
+            stats = self.sites[site]
+            stats.acquisitions += 1
+            stats.waits.add(self.acquired - start)
+
+    def release(self):
+
+        hold = time.perf_counter() - self.acquired
+        site = self.holder
+
+        self.holder = None
+
+        self.lock.release()
+
+        with self.sem:
+
+            stats = self.sites[site]
+            stats.holds.add(hold)
+
+            if hold > self.slowHold:
+                stats.slowHolds += 1
+
+        if hold > self.slowHold:
+            logger.warning("[{}] Held {:.3f}s by {}\n{}".format(self.name,
+                                                                hold,
+                                                                site,
+                                                                ''.join(traceback.format_stack()[:-1])))
+
+    ######
+    # Returns the aggregates per site and the current holder
+    ######
+    def stats(self):
+
+        holder = self.holder
+
+        with self.sem:
+
+            sites = OrderedDict()
+
+            for site, stats in self.sites.items():
+                sites[site] = {'acquisitions' : stats.acquisitions,
+                               'slowHolds' : stats.slowHolds,
+                               'wait' : stats.waits.stats(),
+                               'hold' : stats.holds.stats()}
+
+        return {'name' : self.name,
+                'holder' : holder,
+                'held' : time.perf_counter() - self.acquired if holder else 0,
+                'sites' : sites}
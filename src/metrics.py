@@ -0,0 +1,181 @@
+##
+# Part of `SmartNodeMonitorBot`
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+##
+
+import os
+import json
+import time
+import logging
+import threading
+from collections import deque, OrderedDict
+
+logger = logging.getLogger("metrics")
+
+# Upper bounds in seconds of the histogram buckets, the last bucket
+# collects everything above.
+BUCKETS = [0.001, 0.01, 0.1, 1, 10, 60]
+
+#####
+#
+# Durations of the last size samples.
+#
+# Beside the window the total count and the maximum since the start are
+# kept.
+#
+#####
+
+class RollingHistogram(object):
+
+    def __init__(self, size = 100):
+        self.values = deque(maxlen=size)
+        self.count = 0
+        self.max = 0
+
+    def __len__(self):
+        return len(self.values)
+
+    def add(self, value):
+        self.values.append(value)
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def last(self):
+        return self.values[-1] if len(self.values) else 0
+
+    def average(self):
+        return sum(self.values) / len(self.values) if len(self.values) else 0
+
+    def percentile(self, q):
+
+        values = sorted(self.values)
+
+        return values[int(q / 100.0 * (len(values) - 1))] if len(values) else 0
+
+    def buckets(self):
+
+        counts = [0] * (len(BUCKETS) + 1)
+
+        for value in self.values:
+
+            bucket = 0
+
+            while bucket < len(BUCKETS) and value > BUCKETS[bucket]:
+                bucket += 1
+
+            counts[bucket] += 1
+
+        return counts
+
+    def stats(self):
+        return {'count' : self.count,
+                'last' : self.last(),
+                'average' : self.average(),
+                'p50' : self.percentile(50),
+                'p95' : self.percentile(95),
+                'max' : self.max,
+                'buckets' : self.buckets()}
+
+#####
+#
+# Timing spans of the phases of a repeated task.
+#
+#   with timings.span('fetch'):
+#       ...
+#
+# or for phases which don't fit into a block
+#
+#   span = timings.start('fetch')
+#   ...
+#   span.stop()
+#
+# Each phase keeps a RollingHistogram of its durations. The phases get
+# reported in the order of their first appearance.
+#
+#####
+
+class Span(object):
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        return self.begin()
+
+    def __exit__(self, type, value, traceback):
+        self.stop()
+
+    def begin(self):
+        self.start = time.perf_counter()
+        return self
+
+    def stop(self):
+        self.timings.add(self.name, time.perf_counter() - self.start)
+
+class PhaseTimings(object):
+
+    def __init__(self, size = 100):
+        self.size = size
+        self.sem = threading.Lock()
+        self.phases = OrderedDict()
+
+    def span(self, name):
+        return Span(self, name)
+
+    def start(self, name):
+        return Span(self, name).begin()
+
+    def add(self, name, duration):
+
+        with self.sem:
+
+            if not name in self.phases:
+                self.phases[name] = RollingHistogram(self.size)
+
+            self.phases[name].add(duration)
+
+    def stats(self):
+
+        with self.sem:
+            return OrderedDict((name, histogram.stats()) for name, histogram in self.phases.items())
+
+######
+# Write the metrics dict as JSON into path. The file gets replaced atomically.
+######
+def dump(path, metrics):
+
+    tmpPath = path + '.tmp'
+
+    try:
+
+        with open(tmpPath, 'w') as f:
+            json.dump(metrics, f, indent=2)
+
+        os.replace(tmpPath, path)
+
+    except (OSError, TypeError, ValueError) as e:
+        logger.error("Could not write the metrics {}: {}".format(path, e))
+        return False
+
+    return True
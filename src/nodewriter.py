@@ -0,0 +1,267 @@
+##
+# Part of `SmartNodeMonitorBot`
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+##
+
+import time
+import logging
+import threading
+
+from src.scheduler import Scheduler
+
+logger = logging.getLogger("nodewriter")
+
+#####
+#
+# Write-behind queue for the node database.
+#
+# The changes of the nodelist get queued and written by the scheduler
+# thread every interval seconds or as soon as maxPending changes are
+# queued. Repeated changes of the same collateral get coalesced, the
+# changed columns are merged and only their latest values get written.
+# New nodes get inserted with all columns. The complete row of each node
+# is kept along to write it completely if it went missing in the
+# database. The collateral heights get coalesced per transaction hash.
+#
+# Failed writes stay queued for the next run unless newer changes of the
+# same collateral arrived in between. stop() writes everything left.
+#
+# Each queue call gets a sequence number, flushedSequence() tells up to
+# which one all changes are in the database. The optional flushCB gets
+# called after each successful write.
+#
+#####
+
+class NodeWriter(object):
+
+    def __init__(self, db, interval = 5, maxPending = 5000, errorCB = None, flushCB = None):
+
+        self.db = db
+        self.interval = interval
+        self.maxPending = maxPending
+        self.errorCB = errorCB
+        self.flushCB = flushCB
+
+        self.running = False
+        self.sem = threading.Lock()
+        self.flushSem = threading.Lock()
+        self.scheduler = Scheduler("nodewriter", interval, self.flush, stallTimeout = 120, alertCB = errorCB)
+
+        # collateral string => (columns, row of nodeRow()) or None for removals.
+        # columns is None for inserts.
+        self.pending = {}
+        # txhash => height
+        self.heights = {}
+
+        # Sequence number of the last queued and the last written changes
+        self.sequence = 0
+        self.flushed = 0
+
+        self.queued = 0
+        self.written = 0
+        self.flushs = 0
+        self.failures = 0
+        self.lastFlush = 0
+
+    def start(self):
+        self.running = True
+        self.scheduler.start()
+
+    ######
+    # Stop the writer thread and write everything left
+    ######
+    def stop(self):
+
+        self.running = False
+        self.scheduler.stop()
+
+        self.flush()
+
+        pending = self.pendingCount()
+
+        if pending:
+            logger.error("{} changes could not be written".format(pending))
+
+    def pendingCount(self):
+
+        with self.sem:
+            return len(self.pending) + len(self.heights)
+
+    ######
+    # Sequence number of the last queued changes
+    ######
+    def queuedSequence(self):
+
+        with self.sem:
+            return self.sequence
+
+    ######
+    # Sequence number up to which all changes are written
+    ######
+    def flushedSequence(self):
+
+        with self.sem:
+            return self.flushed
+
+    ######
+    # Queue the changes and the collaterals for removal. changes are
+    # (node, columns) tuples, columns None inserts the node with all
+    # columns. The values get taken from the node right away.
+    ######
+    def updateColumns(self, changes = None, removed = None):
+
+        changes = [ (columns, self.db.nodeRow(node)) for node, columns in changes ] if changes else []
+
+        with self.sem:
+
+            for columns, row in changes:
+                self.pending[row[-1]] = self.merge(self.pending.get(row[-1]), (columns, row))
+
+            for collateral in removed if removed else []:
+                self.pending[str(collateral)] = None
+
+            self.queued += len(changes) + (len(removed) if removed else 0)
+            self.sequence += 1
+            full = len(self.pending) >= self.maxPending
+
+        self.schedule(full)
+
+    ######
+    # Queue the (txhash, height) tuples
+    ######
+    def addCollateralHeights(self, heights):
+
+        with self.sem:
+            self.heights.update(heights)
+            self.queued += len(heights)
+            self.sequence += 1
+            full = len(self.heights) >= self.maxPending
+
+        self.schedule(full)
+
+    ######
+    # Returns the pending entry of a collateral with the newer entry applied
+    ######
+    @staticmethod
+    def merge(current, entry):
+
+        if not current or not entry:
+            return entry
+
+        if current[0] == None or entry[0] == None:
+            return (None, entry[1])
+
+        return (set(current[0]) | set(entry[0]), entry[1])
+
+    def schedule(self, full):
+
+        if not self.running:
+            logger.warning("Writer not running, write directly")
+            self.flush()
+        elif full:
+            self.scheduler.trigger()
+
+    def flush(self):
+
+        with self.flushSem:
+
+            with self.sem:
+                pending = self.pending
+                heights = self.heights
+                sequence = self.sequence
+                self.pending = {}
+                self.heights = {}
+
+            if not len(pending) and not len(heights):
+
+                with self.sem:
+                    self.flushed = sequence
+
+                return True
+
+            start = time.time()
+
+            rows = []
+            updates = []
+            removed = []
+
+            for collateral, entry in pending.items():
+
+                if entry == None:
+                    removed.append(collateral)
+                elif entry[0] == None:
+                    rows.append(entry[1])
+                else:
+                    updates.append(entry)
+
+            success = self.db.writeRows(rows, removed, list(heights.items()), updates)
+
+            if not success:
+
+                with self.sem:
+
+                    self.failures += 1
+
+                    # Keep the newer changes which arrived meanwhile
+                    for collateral, entry in self.pending.items():
+                        pending[collateral] = self.merge(pending.get(collateral), entry)
+
+                    heights.update(self.heights)
+                    self.pending = pending
+                    self.heights = heights
+
+                msg = "Could not write the nodelist changes into the database!"
+                logger.error(msg)
+
+                if self.errorCB:
+                    self.errorCB(msg)
+
+                return False
+
+            with self.sem:
+                self.flushs += 1
+                self.written += len(pending) + len(heights)
+                self.lastFlush = time.time()
+                self.flushed = sequence
+
+            logger.debug("Wrote {} changes, {} heights in {:.3f}s".format(len(pending), len(heights), time.time() - start))
+
+            if self.flushCB:
+
+                try:
+                    self.flushCB()
+                except Exception as e:
+                    logger.error("flushCB failed: {}".format(e), exc_info=True)
+
+            return True
+
+    def stats(self):
+
+        with self.sem:
+            return {'pending' : len(self.pending) + len(self.heights),
+                    'queued' : self.queued,
+                    'written' : self.written,
+                    'flushs' : self.flushs,
+                    'failures' : self.failures,
+                    'lastFlush' : self.lastFlush,
+                    'sequence' : self.sequence,
+                    'flushed' : self.flushed}
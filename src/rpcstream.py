@@ -0,0 +1,244 @@
+##
+# Part of `SmartNodeMonitorBot`
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+##
+
+import re
+import json
+import codecs
+import logging
+import requests
+
+logger = logging.getLogger("rpcstream")
+
+whitespace = re.compile(r'[ \t\n\r]*')
+
+class RPCStreamError(Exception):
+    pass
+
+#####
+#
+# Incremental JSON parser for a chunked response.
+#
+# Only a small window of the response is kept in memory. Values get decoded
+# one by one with json.JSONDecoder.raw_decode, the structure around them is
+# walked by the caller with expect()/peek().
+#
+#####
+
+class StreamParser(object):
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.decoder = json.JSONDecoder()
+        self.textDecoder = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.pos = 0
+
+    # Append the next chunk, returns False at the end of the response.
+    def fill(self):
+
+        for chunk in self.chunks:
+
+            text = self.textDecoder.decode(chunk)
+
+            if text:
+                self.buffer = self.buffer[self.pos:] + text
+                self.pos = 0
+                return True
+
+        return False
+
+    # Returns the next non whitespace character without consuming it
+    def peek(self):
+
+        while True:
+
+            self.pos = whitespace.match(self.buffer, self.pos).end()
+
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+
+            if not self.fill():
+                return None
+
+    def expect(self, characters):
+
+        character = self.peek()
+
+        if character == None or character not in characters:
+            raise RPCStreamError("Expected one of '{}', got '{}'".format(characters, character))
+
+        self.pos += 1
+
+        return character
+
+    def value(self):
+
+        self.peek()
+
+        while True:
+
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as e:
+                # The value might be split between two chunks
+                if self.fill():
+                    continue
+                raise RPCStreamError("Invalid response: {}".format(e))
+
+            # A number at the end of the buffer might be incomplete
+            if end == len(self.buffer) and self.fill():
+                continue
+
+            self.pos = end
+
+            return value
+
+#####
+#
+# Rows of a streamed nodelist response. Iterate over it to receive the
+# (key, row) tuples, close() releases the response if it gets not consumed.
+#
+#####
+
+class NodeListRows(object):
+
+    def __init__(self, parser, response):
+        self.parser = parser
+        self.response = response
+        self.rows = self.parse()
+
+    def __iter__(self):
+        return self.rows
+
+    def close(self):
+        self.rows.close()
+        self.response.close()
+
+    def parse(self):
+
+        parser = self.parser
+
+        try:
+
+            parser.expect('{')
+
+            if parser.peek() == '}':
+                return
+
+            while True:
+
+                key = parser.value()
+                parser.expect(':')
+                row = parser.value()
+
+                yield key, row
+
+                if parser.expect(',}') == '}':
+                    break
+
+        except requests.exceptions.RequestException as e:
+            raise RPCStreamError("Response broke off: {}".format(e))
+
+        finally:
+            self.response.close()
+
+#####
+#
+# Streaming client for the smartnode list of the RPC server.
+#
+# Instead of loading the full response into a dict the rows of the result
+# object are yielded one by one while the response gets received.
+#
+#####
+
+class NodeListStream(object):
+
+    def __init__(self, url, port, user, password, timeout, chunkSize = 65536):
+        self.url = "{}:{}".format(url, port)
+        self.auth = (user, password)
+        self.timeout = timeout
+        self.chunkSize = chunkSize
+        self.requestId = 0
+
+    def request(self, method, params):
+
+        self.requestId += 1
+
+        payload = {'jsonrpc' : '1.0',
+                   'id' : self.requestId,
+                   'method' : method,
+                   'params' : params}
+
+        try:
+            response = requests.post(self.url,
+                                     json=payload,
+                                     auth=self.auth,
+                                     timeout=self.timeout,
+                                     stream=True)
+        except requests.exceptions.RequestException as e:
+            raise RPCStreamError("Request failed: {}".format(e))
+
+        if response.status_code in [401, 403, 404]:
+            response.close()
+            raise RPCStreamError("Request failed with status {}".format(response.status_code))
+
+        return response
+
+    ######
+    # Request the full nodelist. The request and the response up to the first
+    # row are processed here and raise RPCStreamError on failure. Returns
+    # NodeListRows which raises RPCStreamError if the response breaks off
+    # in between.
+    ######
+    def smartNodeList(self, mode = 'full'):
+
+        response = self.request('smartnode', ['list', mode])
+
+        try:
+
+            parser = StreamParser(response.iter_content(self.chunkSize))
+
+            parser.expect('{')
+
+            while parser.peek() != '}':
+
+                key = parser.value()
+                parser.expect(':')
+
+                if key == 'result' and parser.peek() == '{':
+                    return NodeListRows(parser, response)
+
+                value = parser.value()
+
+                if key == 'error' and value != None:
+                    raise RPCStreamError("RPC error: {}".format(value))
+
+                if parser.expect(',}') == '}':
+                    break
+
+            raise RPCStreamError("Response without result")
+
+        except (RPCStreamError, requests.exceptions.RequestException) as e:
+            response.close()
+            raise RPCStreamError(str(e))
@@ -0,0 +1,229 @@
+##
+# Part of `SmartNodeMonitorBot`
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+##
+
+import time
+import logging
+import threading
+
+from src.metrics import RollingHistogram
+
+logger = logging.getLogger("scheduler")
+
+#####
+#
+# Fixed rate scheduler.
+#
+# Runs the task every interval seconds measured from the start of the runs,
+# the duration of the task doesn't shift the schedule. Runs which take longer
+# than the interval are counted as overruns and the missed runs get skipped.
+# With fixedDelay the task runs interval seconds after the end of the last
+# run instead, for tasks whose duration is no overrun but normal operation.
+# Exceptions of the task get logged and don't stop the loop.
+#
+# A watchdog thread restarts the loop if its thread died and reports runs
+# which take longer than stallTimeout seconds to the alertCB.
+#
+#####
+
+class Scheduler(object):
+
+    def __init__(self, name, interval, task, stallTimeout = None, alertCB = None, watchdogInterval = 10,
+                 fixedDelay = False):
+
+        self.name = name
+        self.interval = interval
+        self.task = task
+        self.fixedDelay = fixedDelay
+        self.stallTimeout = stallTimeout
+        self.alertCB = alertCB
+        self.watchdogInterval = watchdogInterval
+
+        self.running = False
+        self.wakeup = threading.Event()
+        self.sem = threading.Lock()
+        self.thread = None
+        self.watchdog = None
+
+        self.nextRun = 0
+        # Start time of the current run or None
+        self.runStart = None
+        self.stalled = False
+
+        self.runs = 0
+        self.errors = 0
+        self.overruns = 0
+        self.missed = 0
+        self.restarts = 0
+        self.lastDuration = 0
+        self.totalDuration = 0
+        self.maxDuration = 0
+        self.lastRun = 0
+        self.durations = RollingHistogram(100)
+
+    def start(self):
+
+        if self.running:
+            raise Exception("Scheduler {} already started!".format(self.name))
+
+        self.running = True
+        self.nextRun = time.time()
+
+        self.startLoop()
+
+        self.watchdog = threading.Thread(target=self.watch, name=self.name + "-watchdog", daemon=True)
+        self.watchdog.start()
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+
+    ######
+    # Run the task as soon as possible without changing the schedule
+    ######
+    def trigger(self):
+        self.wakeup.set()
+
+    def startLoop(self):
+        self.thread = threading.Thread(target=self.loop, name=self.name, daemon=True)
+        self.thread.start()
+
+    def loop(self):
+
+        while self.running:
+
+            triggered = self.wakeup.wait(max(0, self.nextRun - time.time()))
+            self.wakeup.clear()
+
+            if not self.running:
+                break
+
+            self.execute()
+
+            now = time.time()
+
+            if self.fixedDelay:
+                self.nextRun = now + self.interval
+            # Triggered runs before the next scheduled one keep the schedule
+            elif not triggered or now >= self.nextRun:
+                self.advance(now)
+
+    def execute(self):
+
+        start = time.time()
+        self.runStart = start
+
+        try:
+            self.task()
+        except Exception as e:
+            self.errors += 1
+            logger.error("[{}] Task failed: {}".format(self.name, e), exc_info=True)
+
+        duration = time.time() - start
+
+        with self.sem:
+            self.runStart = None
+            self.runs += 1
+            self.lastRun = start
+            self.lastDuration = duration
+            self.totalDuration += duration
+            self.maxDuration = max(self.maxDuration, duration)
+            self.durations.add(duration)
+
+        if self.stalled:
+            self.stalled = False
+            logger.warning("[{}] Stalled run finished after {:.1f}s".format(self.name, duration))
+
+    def advance(self, now):
+
+        self.nextRun += self.interval
+
+        if now >= self.nextRun:
+
+            missed = int((now - self.nextRun) / self.interval) + 1
+
+            with self.sem:
+                self.overruns += 1
+                self.missed += missed
+
+            # Only counted, see stats()
+            self.nextRun += missed * self.interval
+
+    def watch(self):
+
+        while self.running:
+
+            time.sleep(self.watchdogInterval)
+
+            if not self.running:
+                break
+
+            if not self.thread.is_alive():
+
+                with self.sem:
+                    self.restarts += 1
+
+                self.alert("[{}] Loop died, restart it".format(self.name))
+                self.startLoop()
+
+            runStart = self.runStart
+
+            if self.stallTimeout and not self.stalled and runStart and\
+               (time.time() - runStart) > self.stallTimeout:
+
+                self.stalled = True
+                self.alert("[{}] Run stalled for more than {}s".format(self.name, self.stallTimeout))
+
+    def alert(self, message):
+
+        logger.error(message)
+
+        if self.alertCB:
+
+            try:
+                self.alertCB(message)
+            except Exception as e:
+                logger.error("[{}] alertCB failed: {}".format(self.name, e))
+
+    ######
+    # Returns the cycle statistics. The percentile is calculated over the
+    # last 100 runs.
+    ######
+    def stats(self):
+
+        with self.sem:
+
+            return {'name' : self.name,
+                    'interval' : self.interval,
+                    'fixedDelay' : self.fixedDelay,
+                    'running' : self.running and self.thread != None and self.thread.is_alive(),
+                    'runs' : self.runs,
+                    'errors' : self.errors,
+                    'overruns' : self.overruns,
+                    'missed' : self.missed,
+                    'restarts' : self.restarts,
+                    'lastRun' : self.lastRun,
+                    'last' : self.lastDuration,
+                    'average' : self.totalDuration / self.runs if self.runs else 0,
+                    'max' : self.maxDuration,
+                    'p95' : self.durations.percentile(95)}
@@ -31,9 +31,22 @@ import csv
 from src import util
 import logging
 import threading
+import copy
+import bisect
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 import re
 
 from smartcash.rpc import *
+from src.collateral import CollateralResolver
+from src.columns import NodeColumns
+from src.snapshot import NodeListSnapshot, SnapshotError
+from src.rpcstream import RPCStreamError
+from src.blockwatch import BlockWatcher
+from src.metrics import PhaseTimings
+from src.locking import InstrumentedLock
+from src.nodewriter import NodeWriter
+from src import metrics
 
 # Index assignment of the "smartnodelist full"
 STATUS_INDEX = 0
@@ -52,6 +65,17 @@ POS_UPDATE_REQUIRED = -3
 POS_TOO_NEW = -4
 POS_COLLATERAL_AGE = -5
 
+# Key of the update dict of SmartNode.update() => changed database columns
+UPDATE_COLUMNS = {'status' : ('status',),
+                  'protocol' : ('protocol',),
+                  'payee' : ('payee',),
+                  'lastPaid' : ('last_paid_block', 'last_paid_time'),
+                  'ip' : ('ip',),
+                  'timeout' : ('timeout',)}
+
+# Database columns which change with almost every row of the list
+VOLATILE_COLUMNS = ('activeseconds', 'last_seen')
+
 HF_1_2_MULTINODE_PAYMENTS = 545005
 HF_1_2_8_COLLATERAL_CHANGE = 910000
 
@@ -60,13 +84,35 @@ logger = logging.getLogger("smartnodes")
 transactionRawCheck = re.compile("COutPoint\([\d\a-f]{64},.[\d]{1,}\)")
 transactionStringCheck = re.compile("[\d\a-f]{64}-[\d]{1,}")
 
+######
+# Payees, IPs, status and protocol values are shared by many nodes and are
+# stored only once.
+######
+protocolValues = {}
+
+def internString(value):
+    return sys.intern(str(value))
+
+def internProtocol(value):
+    value = int(value)
+    return protocolValues.setdefault(value, value)
+
 class Transaction(object):
 
+    # The hash is stored as the 32 bytes of the core's uint256 which are in
+    # reversed order of the hex string. Comparing the raw bytes equals the
+    # memcmp of the core's uint256 data.
+    __slots__ = ('raw', 'index', 'block')
+
     def __init__(self, txhash, txindex, block):
-        self.hash = txhash
+        self.raw = bytes.fromhex(txhash)[::-1]
         self.index = txindex
         self.block = block
 
+    @property
+    def hash(self):
+        return self.raw[::-1].hex()
+
     def updateBlock(self, block):
         self.block = block
 
@@ -74,7 +120,8 @@ class Transaction(object):
         return '{0.hash}-{0.index}'.format(self)
 
     def __eq__(self, other):
-        return self.hash == other.hash and\
+        return isinstance(other, Transaction) and\
+                self.raw == other.raw and\
                 self.index == other.index
 
     def __lt__(self, other):
@@ -90,12 +137,11 @@ class Transaction(object):
         # https://github.com/SmartCash/smartcash/blob/1.1.1/src/uint256.h#L45
         # https://github.com/SmartCash/smartcash/blob/1.1.1/src/primitives/transaction.h#L38
         # https://github.com/SmartCash/smartcash/blob/1.1.1/src/primitives/transaction.h#L126
-        compare = util.memcmp(bytes.fromhex(self.hash), bytes.fromhex(other.hash),len(bytes.fromhex(self.hash)))
-        return compare < 0 or ( compare == 0 and self.index < other.index )
+        return self.raw < other.raw or (self.raw == other.raw and self.index < other.index)
 
 
     def __hash__(self):
-        return hash((self.hash,self.index))
+        return hash((self.raw,self.index))
 
     @classmethod
     def fromRaw(cls, s):
@@ -104,6 +150,16 @@ class Transaction(object):
             parts = s[10:-1].split(', ')
             return cls(parts[0], int(parts[1]), -1)
 
+    @classmethod
+    def fromBytes(cls, raw, txindex, block):
+
+        transaction = cls.__new__(cls)
+        transaction.raw = raw
+        transaction.index = txindex
+        transaction.block = block
+
+        return transaction
+
     @classmethod
     def fromString(cls, s):
 
@@ -112,45 +168,85 @@ class Transaction(object):
             return cls(parts[0], int(parts[1]), -1)
 
 ####
-# Used for the sort of the last paid vector
+# Ordered payment queue of the qualified nodes. The entries are sorted by
+# (lastPaidBlock, collateral) like the core does it and are kept sorted on
+# insertion, so only nodes which join, leave or move need to be touched.
 ###
-class LastPaid(object):
+class PayoutQueue(object):
 
-    def __init__(self, lastPaidBlock, transaction):
-        self.transaction = transaction
-        self.lastPaidBlock = lastPaidBlock
+    def __init__(self):
+        self.entries = []
+        self.keys = {}
 
-    def __str__(self):
-        return '[{0.lastPaidBlock}] {0.transaction}'.format(self)
+    def __len__(self):
+        return len(self.entries)
 
-    def __lt__(self, other):
+    def __contains__(self, collateral):
+        return collateral in self.keys
+
+    def __iter__(self):
+        return map(lambda x: x[-1], self.entries)
+
+    def update(self, collateral, lastPaidBlock):
 
-        if self.lastPaidBlock != other.lastPaidBlock:
-            return self.lastPaidBlock < other.lastPaidBlock
+        key = self.keys.get(collateral)
 
-        return self.transaction < other.transaction
+        if key and key[0] == lastPaidBlock:
+            return False
+
+        if key:
+            self.remove(collateral)
+
+        # The sort key of the collateral is unique, the collateral itself
+        # never gets compared.
+        key = (lastPaidBlock, collateral.raw, collateral.index, collateral)
+
+        bisect.insort(self.entries, key)
+        self.keys[collateral] = key
+
+        return True
+
+    def remove(self, collateral):
+
+        key = self.keys.pop(collateral, None)
+
+        if key:
+            del self.entries[bisect.bisect_left(self.entries, key)]
+            return True
+
+        return False
 
 class SmartNode(object):
 
+    __slots__ = ('collateral', 'payee', 'status', 'activeSeconds',
+                 'lastPaidBlock', 'lastPaidTime', 'lastSeen', 'protocol',
+                 'rank', 'ip', 'timeout', 'position')
+
     def __init__(self, **kwargs):
 
         self.collateral = kwargs['collateral']
-        self.payee = str(kwargs['payee'])
-        self.status = str(kwargs['status'])
+        self.payee = internString(kwargs['payee'])
+        self.status = internString(kwargs['status'])
         self.activeSeconds = int(kwargs['active_seconds'])
         self.lastPaidBlock = int(kwargs['last_paid_block'])
         self.lastPaidTime = int(kwargs['last_paid_time'])
         self.lastSeen = int(kwargs['last_seen'])
-        self.protocol = int(kwargs['protocol'])
+        self.protocol = internProtocol(kwargs['protocol'])
         self.rank = int(kwargs['rank'])
-        self.ip = str(kwargs['ip'])
+        self.ip = internString(kwargs['ip'])
         self.timeout = int(kwargs['timeout'])
         self.position = POS_CALCULATING
 
     @classmethod
     def fromRaw(cls,collateral, raw):
+        return cls.fromFields(collateral, raw.split())
 
-        data = raw.split()
+    ######
+    # Create a node from the split row of the "smartnodelist full", see
+    # the *_INDEX constants for the layout.
+    ######
+    @classmethod
+    def fromFields(cls, collateral, data):
 
         return cls(collateral = collateral,
                    payee = data[PAYEE_INDEX],
@@ -182,7 +278,46 @@ class SmartNode(object):
                    rank = -1,
                    timeout = row['timeout'] )
 
-    def update(self, raw):
+    ######
+    # Create a node from a record of the nodelist snapshot, see
+    # src.snapshot.NODE_FIELDS for the order of the values. The values are
+    # already typed and the strings interned by the snapshot.
+    ######
+    @classmethod
+    def fromSnapshot(cls, values):
+
+        node = cls.__new__(cls)
+
+        (txhash, txindex, block,
+         node.status, protocol, node.payee,
+         node.activeSeconds, node.lastPaidBlock, node.lastPaidTime, node.lastSeen,
+         node.ip, node.timeout, node.position) = values
+
+        node.collateral = Transaction.fromBytes(txhash, txindex, block)
+        node.protocol = internProtocol(protocol)
+        node.rank = -1
+
+        return node
+
+    def snapshotValues(self):
+        return (self.collateral.raw,
+                self.collateral.index,
+                self.collateral.block,
+                self.status,
+                self.protocol,
+                self.payee,
+                self.activeSeconds,
+                self.lastPaidBlock,
+                self.lastPaidTime,
+                self.lastSeen,
+                self.ip,
+                self.timeout,
+                self.position)
+
+    ######
+    # Update the node with the split row of the "smartnodelist full".
+    ######
+    def update(self, data):
 
         update = {'status' : False,
                   'payee':False,
@@ -192,39 +327,25 @@ class SmartNode(object):
                   'ip' : False
                  }
 
-        data = raw.split()
-
         status = data[STATUS_INDEX].replace('_','-') # replace _ with - to avoid md problems
 
         if self.status != status:
             logger.info("[{}] Status updated {} => {}".format(self.collateral, self.status, status))
             update['status'] = True
-            self.status = status
+            self.status = internString(status)
 
         if int(self.protocol) != int(data[PROTOCOL_INDEX]):
             logger.info("[{}] Protocol updated {} => {}".format(self.collateral, self.protocol, int(data[PROTOCOL_INDEX])))
             update['protocol'] = True
-            self.protocol = int(data[PROTOCOL_INDEX])
+            self.protocol = internProtocol(data[PROTOCOL_INDEX])
 
         if self.payee != data[PAYEE_INDEX]:
             logger.info("[{}] Payee updated {} => {}".format(self.collateral, self.payee, data[PAYEE_INDEX]))
             update['payee'] = True
-            self.payee = data[PAYEE_INDEX]
+            self.payee = internString(data[PAYEE_INDEX])
 
         self.lastSeen = int(data[SEEN_INDEX])
-        lastSeenDiff = ( int(time.time()) - self.lastSeen )
-        if lastSeenDiff > 3600 and\
-            lastSeenDiff < 7200: # > 60min < 120min
-
-            if ( self.timeout == -1 or \
-              ( int(time.time()) - self.timeout ) > 600 ) and\
-              self.status == 'ENABLED':
-                self.timeout = int(time.time())
-                update['timeout'] = True
-
-        elif self.timeout != -1 and self.status == 'ENABLED':
-            self.timeout = -1
-            update['timeout'] = True
+        update['timeout'] = self.checkTimeout()
 
         self.activeSeconds = int(data[ACTIVE_INDEX])
 
@@ -241,13 +362,71 @@ class SmartNode(object):
         if self.ip != data[IPINDEX_INDEX]:
             logger.info("[{}] IP updated {} => {}".format(self.collateral, self.ip, data[IPINDEX_INDEX]))
             update['ip'] = True
-            self.ip = data[IPINDEX_INDEX]
+            self.ip = internString(data[IPINDEX_INDEX])
 
         if update['timeout'] :
             logger.debug("[{}] Timeout updated {}".format(self.collateral, self.timeout))
 
         return update
 
+    ######
+    # Used for nodes whose raw row did not change since the last update. The
+    # only thing that can change without a new row is the timeout state which
+    # depends on the current time.
+    ######
+    def refresh(self):
+
+        update = {'status' : False,
+                  'payee':False,
+                  'timeout' : False,
+                  'lastPaid' : False,
+                  'protocol' : False,
+                  'ip' : False
+                 }
+
+        update['timeout'] = self.checkTimeout()
+
+        if update['timeout'] :
+            logger.debug("[{}] Timeout updated {}".format(self.collateral, self.timeout))
+
+        return update
+
+    def checkTimeout(self):
+
+        timeout = self.nextTimeout()
+
+        if timeout != self.timeout:
+            self.timeout = timeout
+            return True
+
+        return False
+
+    def nextTimeout(self):
+
+        lastSeenDiff = ( int(time.time()) - self.lastSeen )
+        if lastSeenDiff > 3600 and\
+            lastSeenDiff < 7200: # > 60min < 120min
+
+            if ( self.timeout == -1 or \
+              ( int(time.time()) - self.timeout ) > 600 ) and\
+              self.status == 'ENABLED':
+                return int(time.time())
+
+        elif self.timeout != -1 and self.status == 'ENABLED':
+            return -1
+
+        return self.timeout
+
+    ######
+    # Copy of the node with its own collateral object
+    ######
+    def copy(self):
+
+        node = copy.copy(self)
+        node.collateral = copy.copy(self.collateral)
+
+        return node
+
     def payoutBlockString(self):
 
         if self.lastPaidBlock > 0:
@@ -295,16 +474,96 @@ class SmartNode(object):
 
         return False
 
-class SmartNodeList(object):
+######
+# Aggregated status and protocol counters of the nodelist. They get updated
+# with each added, changed or removed node instead of counting the whole
+# list after each update.
+######
+class NodeCounters(object):
 
-    def __init__(self, db, rpcConfig):
+    def __init__(self):
+        self.statuses = {}
+        self.protocols = {}
+        # (status, protocol) => count
+        self.combined = {}
+
+    def copy(self):
+
+        counters = NodeCounters()
+        counters.statuses = dict(self.statuses)
+        counters.protocols = dict(self.protocols)
+        counters.combined = dict(self.combined)
+
+        return counters
+
+    def add(self, status, protocol, count = 1):
+
+        for counter, key in [(self.statuses, status),
+                             (self.protocols, protocol),
+                             (self.combined, (status, protocol))]:
+
+            value = counter.get(key, 0) + count
+
+            if value > 0:
+                counter[key] = value
+            else:
+                counter.pop(key, None)
+
+    def remove(self, status, protocol):
+        self.add(status, protocol, -1)
+
+    def change(self, oldStatus, oldProtocol, status, protocol):
+
+        if oldStatus != status or oldProtocol != protocol:
+            self.remove(oldStatus, oldProtocol)
+            self.add(status, protocol)
+
+    def status(self, status, protocol = None):
+
+        if protocol == None:
+            return self.statuses.get(status, 0)
+
+        return self.combined.get((status, protocol), 0)
+
+    def protocol(self, protocol):
+        return self.protocols.get(protocol, 0)
+
+######
+# Network parameters derived once per update cycle from the nodelist. The
+# record is immutable and gets published together with the state so that
+# all readers report the numbers of the same cycle.
+######
+NetworkParameters = namedtuple('NetworkParameters', ['protocolRequirement',
+                                                     'enabledOldProtocol',
+                                                     'enabledNewProtocol',
+                                                     'enabledWithMinProtocol',
+                                                     'scale',
+                                                     'minimumUptime',
+                                                     'minimumConfirmations',
+                                                     'top10',
+                                                     'qualifiedNormal',
+                                                     'qualifiedUpgrade',
+                                                     'upgradeModeDuration'])
+
+#####
+#
+# Read only state of the nodelist. SmartNodeList is the writer and publishes
+# a copy of this state after each update. Readers get the latest published
+# state with SmartNodeList.snapshot() and don't need to lock the list.
+#
+#####
+
+######
+# Results of the RPC calls of one update cycle and the duration of each call
+# in seconds. nodes is None if the list was not requested.
+######
+CycleInput = namedtuple('CycleInput', ['syncStatus', 'protocol', 'info', 'nodes', 'timings'])
+
+class NodeListState(object):
+
+    def __init__(self):
 
-        self.running = False
-        self.nodeListSem = threading.Lock()
         self.lastBlock = 0
-        self.remainingUpgradeModeDuration = None
-        self.qualifiedUpgrade = -1
-        self.qualifiedNormal = 0
         self.oldProtocol = 0
         self.newProtocol = 0
         self.activeProtocol = 90028 # Default to 90028
@@ -315,27 +574,280 @@ class SmartNodeList(object):
         self.preEnabled = 0
         self.expired = 0
         self.newStartRequired = 0
-        self.lastPaidVec = []
+        self.chainSynced = False
+        self.nodeListSynced = False
+        self.winnersListSynced = False
         self.nodes = {}
+        # Secondary indexes ip => (collaterals) and payee => (collaterals).
+        # The values are tuples which get replaced on changes so that a
+        # shallow copy of the dicts is enough for a published state.
+        self.ipIndex = {}
+        self.payeeIndex = {}
+        self.counters = NodeCounters()
+        # Columnar mirror of the nodes for the network wide statistics
+        self.columns = NodeColumns()
+        self.parameters = self.calculateParameters()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        pass
+
+    ######
+    # Create a copy of the state. The nodes dict gets copied, the nodes
+    # itself are shared and must not be modified anymore.
+    ######
+    def copyState(self):
+
+        state = NodeListState()
+
+        for attribute in vars(state):
+            setattr(state, attribute, getattr(self, attribute))
+
+        state.nodes = dict(self.nodes)
+        state.ipIndex = dict(self.ipIndex)
+        state.payeeIndex = dict(self.payeeIndex)
+        state.counters = self.counters.copy()
+
+        return state
+
+    def synced(self):
+        return self.chainSynced and self.nodeListSynced and self.winnersListSynced and self.lastBlock
+
+    def count(self, protocol = -1):
+
+        if protocol == self.oldProtocol:
+            return self.countOldProtocol
+        elif protocol == self.newProtocol:
+            return self.countNewProtocol
+        else:
+            return len(self.nodes)
+
+    def protocolRequirement(self):
+        return self.activeProtocol
+
+    ######
+    # Number of nodes per status/protocol value of all values in the list.
+    ######
+    def statusHistogram(self):
+        return dict(self.counters.statuses)
+
+    def protocolHistogram(self):
+        return dict(self.counters.protocols)
+
+    ######
+    # Derive the network parameters from the current counters. Called once
+    # per update cycle, use the published record in self.parameters instead
+    # of calling this.
+    ######
+    def calculateParameters(self, qualifiedNormal = 0, qualifiedUpgrade = -1, upgradeModeDuration = None):
+
+        protocolRequirement = self.protocolRequirement()
+
+        if protocolRequirement == self.oldProtocol:
+            enabledWithMinProtocol = self.enabledOldProtocol + self.enabledNewProtocol
+        elif protocolRequirement == self.newProtocol:
+            enabledWithMinProtocol = self.enabledNewProtocol
+        else:
+            enabledWithMinProtocol = 0
+
+        if self.lastBlock >= HF_1_2_MULTINODE_PAYMENTS and self.lastBlock < HF_1_2_8_COLLATERAL_CHANGE:
+            scale = 5 # 10/2 => 10 nodes every other block
+        elif self.lastBlock >= HF_1_2_8_COLLATERAL_CHANGE:
+            scale = 0.5 # 1/2 => 1 node every other block
+        else:
+            scale = 1
+
+        return NetworkParameters(protocolRequirement = protocolRequirement,
+                                 enabledOldProtocol = self.enabledOldProtocol,
+                                 enabledNewProtocol = self.enabledNewProtocol,
+                                 enabledWithMinProtocol = enabledWithMinProtocol,
+                                 scale = scale,
+                                 #https://github.com/SmartCash/Core-Smart/blob/44b5543d0e05be27405bdedcc72b4361cee8129d/src/smartnode/smartnodeman.cpp#L557
+                                 minimumUptime = ( enabledWithMinProtocol * 55 ) / scale,
+                                 #https://github.com/SmartCash/Core-Smart/blob/44b5543d0e05be27405bdedcc72b4361cee8129d/src/smartnode/smartnodeman.cpp#L560
+                                 minimumConfirmations = enabledWithMinProtocol / scale,
+                                 top10 = enabledWithMinProtocol * 0.1,
+                                 qualifiedNormal = qualifiedNormal,
+                                 qualifiedUpgrade = qualifiedUpgrade,
+                                 upgradeModeDuration = upgradeModeDuration)
+
+    def enabled(self, protocol = -1):
+
+        if protocol == self.oldProtocol:
+            return self.enabledOldProtocol
+        elif protocol == self.newProtocol:
+            return self.enabledNewProtocol
+        else:
+            return self.enabledOldProtocol + self.enabledNewProtocol
+
+    def getNodeByIp(self, ip):
+
+        if not ':9678' in ip:
+            ip += ":9678"
+
+        collaterals = self.ipIndex.get(ip, ())
+
+        if len(collaterals) == 1:
+            return self.nodes[collaterals[0]]
+
+        return None
+
+    def getNodeByPosition(self, position):
+
+        collateral = self.columns.find('position', position)
+
+        if collateral != None:
+            return self.nodes.get(collateral)
+
+        return None
+
+    def getNodesByPayee(self, payee):
+        return [ self.nodes[collateral] for collateral in self.payeeIndex.get(payee, ()) ]
+
+    def getNodes(self, collaterals):
+
+        filtered = []
+
+        for c in collaterals:
+
+            collateral = None
+
+            if isinstance(c,Transaction):
+                collateral = collateral
+            else:
+                collateral = Transaction.fromString(c)
+                logger.debug("collateral from string ")
+
+            if collateral in self.nodes:
+                filtered.append(self.nodes[collateral])
+
+        return filtered
+
+    def lookup(self, ip):
+
+        result = None
+
+        node = self.getNodeByIp(ip)
+
+        logger.info("lookup {} - found {}".format(ip, node != None))
+
+        if node:
+
+            result = {}
+            parameters = self.parameters
+
+            uptimeString = None
+
+            if node.activeSeconds > 0:
+                uptimeString = util.secondsToText(node.activeSeconds)
+            else:
+                uptimeString = "No uptime!"
+
+            result['ip'] = node.cleanIp()
+            result['position'] = node.position < parameters.top10 and node.position > 0
+            result['position_string'] = node.positionString(parameters.minimumUptime)
+
+            result['status'] = node.status == 'ENABLED'
+            result['status_string'] = "{}".format(node.status)
+
+            result['uptime'] = node.activeSeconds >= parameters.minimumUptime
+            result['uptime_string'] = uptimeString
+
+            result['protocol'] = node.protocol == parameters.protocolRequirement
+            result['protocol_string'] = "{}".format(node.protocol)
+
+            result['collateral'] = node.collateral.block > 0 and\
+                                   (self.lastBlock - node.collateral.block) >= parameters.minimumConfirmations
+
+            result['collateral_string'] = "{}".format((self.lastBlock - node.collateral.block))
+
+            result['upgrade_mode'] = parameters.qualifiedUpgrade != -1
+
+        return result
+
+class SmartNodeList(NodeListState):
+
+    def __init__(self, db, rpcConfig, snapshotPath = None, stream = None):
+
+        super().__init__()
+
+        self.running = False
+        # Records wait and hold times per caller, holds longer than 5 seconds
+        # get logged with the stack of the holder.
+        self.nodeListSem = InstrumentedLock("nodelist", slowHold = 5)
+        self.payoutQueue = PayoutQueue()
+        # Fingerprints of the last raw row of each node in the
+        # "smartnode list full" response. Maps raw key => (collateral, fingerprint)
+        self.rawRows = {}
+        # Collaterals of the nodes which are not shared with the published
+        # state anymore and can be modified in place.
+        self.copied = set()
+        # Latest published state for the readers
+        self.published = None
 
         self.syncedTime = -1
         self.waitAfterSync = 1800
-        self.chainSynced = False
-        self.nodeListSynced = False
-        self.winnersListSynced = False
+
+        # Nodes with unsaved changes of the VOLATILE_COLUMNS. They get written
+        # along with the next other change of the node or for all nodes
+        # every volatileInterval seconds and on stop().
+        self.volatile = set()
+        self.volatileInterval = 600
+        self.lastVolatileFlush = time.time()
+
+        # The list gets refreshed with each new block or after maxStaleness
+        # seconds without a block. notifyPort is the optional UDP port for
+        # block notifications, see src.blockwatch.
+        self.watcher = None
+        self.maxStaleness = 60
+        self.notifyPort = None
 
         self.db = db
+        self.rpcConfig = rpcConfig
         self.rpc = SmartCashRPC(rpcConfig)
+        # Pool for the concurrent RPC calls of an update cycle, each worker
+        # uses its own connection.
+        self.rpcPool = ThreadPoolExecutor(max_workers=4)
+        self.rpcLocal = threading.local()
+        self.rpcTimings = {}
+        # Optional src.rpcstream.NodeListStream to receive the nodelist
+        # without loading the full response into memory.
+        self.stream = stream
+        self.collaterals = CollateralResolver(db, rpcConfig, errorCB = self.pushAdmin)
+        # Writes the changes of the update cycles in the background
+        self.writer = NodeWriter(db, errorCB = self.pushAdmin, flushCB = self.saveFlushedSnapshot)
+        self.snapshotFile = NodeListSnapshot(snapshotPath) if snapshotPath else None
+        # (writer sequence, published state) of the last run. The snapshot
+        # gets written once the writer has its changes in the database,
+        # otherwise a warm start could miss changes which were never written.
+        self.pendingSnapshot = None
+        self.snapshotSem = threading.Lock()
+        # Durations of the phases of the last update cycles and the optional
+        # path of the JSON metrics file written after each cycle.
+        self.phases = PhaseTimings()
+        self.metricsPath = None
 
         self.nodeChangeCB = None
         self.networkCB = None
         self.adminCB = None
 
-        dbList = self.db.getNodes()
+        if not self.loadSnapshot():
 
-        for entry in dbList:
-                node = SmartNode.fromDb(entry)
-                self.nodes[node.collateral] = node
+            dbList = self.db.getNodes()
+
+            for entry in dbList:
+                    node = SmartNode.fromDb(entry)
+                    self.addNode(node)
+
+            self.updateCounts()
+
+        self.columns = NodeColumns.fromNodes(self.nodes)
+
+        self.publish()
+
+        self.writer.start()
 
     def __enter__(self):
         logger.debug("Wait for enter")
@@ -347,20 +859,178 @@ class SmartNodeList(object):
         logger.debug("Exit")
         self.release()
 
+    def addNode(self, node):
+        self.nodes[node.collateral] = node
+        self.addIndex(node)
+        self.counters.add(node.status, node.protocol)
+
+    ######
+    # Load the nodes and the calculated data of the last run from the
+    # snapshot file. Returns False if there is no valid snapshot available.
+    ######
+    def loadSnapshot(self):
+
+        if not self.snapshotFile:
+            return False
+
+        start = time.time()
+
+        try:
+            header, nodes = self.snapshotFile.read()
+        except SnapshotError as e:
+            logger.warning("Could not load the snapshot, use the database: {}".format(e))
+            return False
+
+        for values in nodes:
+            self.addNode(SmartNode.fromSnapshot(values))
+
+        self.lastBlock = header['lastBlock']
+        self.oldProtocol = header['oldProtocol']
+        self.newProtocol = header['newProtocol']
+        self.activeProtocol = header['activeProtocol']
+
+        self.updateCounts()
+
+        upgradeModeDuration = header['upgradeModeDuration']
+
+        self.parameters = self.calculateParameters(header['qualifiedNormal'],
+                                                   header['qualifiedUpgrade'],
+                                                   upgradeModeDuration if upgradeModeDuration >= 0 else None)
+
+        logger.info("Loaded {} nodes from the snapshot of {} in {:.3f}s".format(len(self.nodes),
+                                                                                 time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(header['created'])),
+                                                                                 time.time() - start))
+
+        return True
+
+    ######
+    # Write a published state into the snapshot file.
+    ######
+    def saveSnapshot(self, state):
+
+        if not self.snapshotFile:
+            return False
+
+        header = {'created' : time.time(),
+                  'lastBlock' : state.lastBlock,
+                  'oldProtocol' : state.oldProtocol,
+                  'newProtocol' : state.newProtocol,
+                  'activeProtocol' : state.activeProtocol,
+                  'qualifiedNormal' : state.parameters.qualifiedNormal,
+                  'qualifiedUpgrade' : state.parameters.qualifiedUpgrade,
+                  'upgradeModeDuration' : state.parameters.upgradeModeDuration}
+
+        return self.snapshotFile.write(header, map(lambda x: x.snapshotValues(), state.nodes.values()))
+
+    ######
+    # Write the pending snapshot if the writer has all its changes in the
+    # database. Called after each update and each flush of the writer.
+    ######
+    def saveFlushedSnapshot(self):
+
+        with self.snapshotSem:
+
+            if not self.pendingSnapshot or self.writer.flushedSequence() < self.pendingSnapshot[0]:
+                return False
+
+            sequence, state = self.pendingSnapshot
+            self.pendingSnapshot = None
+
+            with self.phases.span('snapshot'):
+                return self.saveSnapshot(state)
+
+    ######
+    # Returns the latest published state of the list. It is never modified
+    # and can be used without locking the list.
+    ######
+    def snapshot(self):
+        return self.published
+
+    def publish(self):
+        self.published = self.copyState()
+        self.copied = set()
+
+    ######
+    # Returns the node of the collateral ready for modifications. Nodes which
+    # are still shared with the published state get copied first.
+    ######
+    def mutableNode(self, collateral):
+
+        node = self.nodes[collateral]
+
+        if not collateral in self.copied:
+            node = node.copy()
+            self.nodes[collateral] = node
+            self.copied.add(collateral)
+
+        return node
+
+    def addIndex(self, node):
+
+        self.ipIndex[node.ip] = self.ipIndex.get(node.ip, ()) + (node.collateral,)
+        self.payeeIndex[node.payee] = self.payeeIndex.get(node.payee, ()) + (node.collateral,)
+
+    def removeIndex(self, node, ip = None, payee = None):
+
+        for index, key in [(self.ipIndex, ip if ip else node.ip),
+                           (self.payeeIndex, payee if payee else node.payee)]:
+
+            collaterals = tuple(filter(lambda x: x != node.collateral, index.get(key, ())))
+
+            if len(collaterals):
+                index[key] = collaterals
+            else:
+                index.pop(key, None)
+
+    def updateCounts(self):
+
+        self.countOldProtocol = self.counters.protocol(self.oldProtocol)
+        self.countNewProtocol = self.counters.protocol(self.newProtocol)
+
+        self.enabledOldProtocol = self.counters.status("ENABLED", self.oldProtocol)
+        self.enabledNewProtocol = self.counters.status("ENABLED", self.newProtocol)
+
+        self.preEnabled = self.counters.status("PRE-ENABLED")
+        self.expired = self.counters.status("EXPIRED")
+        self.newStartRequired = self.counters.status("NEW-START-REQUIRED")
+
+    ######
+    # Bring the columns up to date with the nodes. They get patched with the
+    # nodes which were modified since the last publish or rebuilt if nodes
+    # were added or removed.
+    ######
+    def updateColumns(self, rebuild = False):
+
+        if rebuild or len(self.columns) != len(self.nodes):
+            self.columns = NodeColumns.fromNodes(self.nodes)
+        else:
+            self.columns = self.columns.patched(self.nodes, self.copied)
+
+    def setPosition(self, collateral, position):
+
+        if self.nodes[collateral].position != position:
+            self.mutableNode(collateral).updatePosition(position)
+
     def acquire(self):
-        logger.info("SmartNodeList acquire")
         self.nodeListSem.acquire()
 
     def release(self):
-        logger.info("SmartNodeList release")
         self.nodeListSem.release()
 
+    def lockStats(self):
+        return self.nodeListSem.stats()
+
     def start(self):
 
         if not self.running:
             logger.info("Start SmartNodeList!")
             self.running = True
-            self.startTimer(5)
+            self.watcher = BlockWatcher(self.blockCount,
+                                        self.update,
+                                        maxStaleness = self.maxStaleness,
+                                        notifyPort = self.notifyPort,
+                                        alertCB = self.pushAdmin)
+            self.watcher.start()
         else:
             raise Exception("SmartNodeList already started!")
 
@@ -371,8 +1041,14 @@ class SmartNodeList(object):
             self.acquire()
             # Inidicate the end
             self.running = False
-            # Stop the timer
-            self.timer.cancel()
+            # Stop the refreshs
+            self.watcher.stop()
+            # Drop pending collateral lookups
+            self.collaterals.stop()
+            # Write the queued changes
+            self.queueChanges({}, [], True)
+            self.writer.stop()
+            self.rpcPool.shutdown(wait=False)
             # Then leave it locked..
             logger.info("Stopped!")
 
@@ -381,52 +1057,145 @@ class SmartNodeList(object):
         if self.adminCB:
             self.adminCB(message)
 
-    def startTimer(self, timeout = 30):
+    ######
+    # Statistics of the refresh scheduler or None if not started.
+    ######
+    def schedulerStats(self):
+        return self.watcher.stats() if self.watcher else None
 
-        if self.running:
-            self.timer = threading.Timer(timeout, self.update)
-            self.timer.daemon = True
-            self.timer.start()
+    ######
+    # Statistics of the database writer and its scheduler
+    ######
+    def writerStats(self):
 
-    def synced(self):
-        return self.chainSynced and self.nodeListSynced and self.winnersListSynced and self.lastBlock
+        stats = self.writer.stats()
+        stats['scheduler'] = self.writer.scheduler.stats()
+
+        return stats
+
+    ######
+    # Metrics of the update cycles for the metrics file
+    ######
+    def metrics(self):
+
+        with self.snapshot() as state:
+            lastBlock = state.lastBlock
+            nodes = state.count()
+
+        return {'time' : time.time(),
+                'lastBlock' : lastBlock,
+                'nodes' : nodes,
+                'phases' : self.phases.stats(),
+                'rpc' : self.rpcTimings,
+                'scheduler' : self.schedulerStats(),
+                'lock' : self.lockStats(),
+                'database' : self.db.stats(),
+                'writer' : self.writerStats()}
+
+    ######
+    # Cheap block check for the refresh scheduler. Returns None on errors.
+    ######
+    def blockCount(self):
+
+        count = self.rpc.raw("getblockcount", [])
+
+        if count.error:
+            logger.warning("blockCount failed: {}".format(str(count.error)))
+            return None
+
+        return count.data
 
     def update(self):
 
-        if self.updateSyncState():
+        with self.phases.span('cycle'):
+            self.updateCycle()
+
+        logger.info("Phases {}".format(", ".join("{} {:.3f}s".format(k, v['last']) for k, v in self.phases.stats().items())))
+
+        if self.metricsPath:
+            metrics.dump(self.metricsPath, self.metrics())
+
+    def updateCycle(self):
+
+        published = False
+
+        with self.phases.span('fetch'):
+            cycle = self.fetchCycleInput()
+
+        with self.phases.span('sync'):
+            synced = self.updateSyncState(cycle.syncStatus)
+
+            if synced:
+                self.updateProtocolRequirement(cycle.protocol)
+
+        if synced:
             logger.info("Start list update!")
-            self.updateProtocolRequirement()
-            self.updateList()
+            published = self.updateList(cycle)
             # Disabled rank updates due to confusion of the users
             #self.updateRanks()
 
-        self.startTimer()
+        # Release the nodelist response if it was not used
+        if cycle.nodes != None and hasattr(cycle.nodes, 'close'):
+            cycle.nodes.close()
 
-    def getCollateralAge(self, txhash):
+        # Make sure the sync state gets published also if the list
+        # was not updated.
+        if not published:
+            with self:
+                self.publish()
 
-        rawTx = self.rpc.getRawTransaction(txhash)
+    def threadRPC(self):
 
-        if rawTx.error:
-            logging.error('Could not fetch raw transaction: {}'.format(str(rawTx.error)))
-            return -1
+        if not hasattr(self.rpcLocal, 'rpc'):
+            self.rpcLocal.rpc = SmartCashRPC(self.rpcConfig)
 
-        if not "blockhash" in rawTx.data:
-            logger.error("getCollateralAge missing blockhash{}".format(rawTx.data))
-            return -1
+        return self.rpcLocal.rpc
 
-        block = self.rpc.getBlockByHash(rawTx.data['blockhash'])
+    def timedCall(self, call):
 
-        if block.error:
-            logging.error('Could not fetch block: {}'.format(str(block.error)))
-            return -1
+        start = time.time()
+        result = call(self.threadRPC())
 
-        if not 'height' in block.data:
-            logger.error("getCollateralAge missing height: {}".format(block.data))
-            return -1
+        return result, time.time() - start
+
+    ######
+    # Issue the independent RPC calls of an update cycle concurrently and
+    # combine their results. The nodelist gets only requested along with the
+    # others if the list was synced in the last cycle, otherwise updateList
+    # requests it once it's needed.
+    ######
+    def fetchCycleInput(self):
+
+        calls = {'syncStatus' : lambda rpc: rpc.getSyncStatus(),
+                 'protocol' : lambda rpc: rpc.raw("smartnode",['protocol']),
+                 'info' : lambda rpc: rpc.getInfo()}
+
+        synced = self.chainSynced and self.nodeListSynced and self.winnersListSynced
+        waiting = self.syncedTime == -2 or\
+                  (self.syncedTime > -1 and (time.time() - self.syncedTime) < self.waitAfterSync)
+
+        if synced and not waiting:
+            calls['nodes'] = lambda rpc: self.fetchList(rpc)
+
+        start = time.time()
 
-        return block.data['height']
+        futures = { name : self.rpcPool.submit(self.timedCall, call) for name, call in calls.items() }
 
-    def updateProtocolRequirement(self):
+        results = {'nodes' : None}
+        timings = {}
+
+        for name, future in futures.items():
+            results[name], timings[name] = future.result()
+
+        timings['total'] = time.time() - start
+
+        self.rpcTimings = timings
+
+        logger.info("RPC timings {}".format(", ".join("{} {:.3f}s".format(k, v) for k, v in timings.items())))
+
+        return CycleInput(timings = timings, **results)
+
+    def updateProtocolRequirement(self, status = None):
 
         #Example command response
         # {
@@ -435,7 +1204,8 @@ class SmartNodeList(object):
         #   "enableTime": 1099511627775,
         #   "activeProtocol": 90028
         # }
-        status = self.rpc.raw("smartnode",['protocol'])
+        if status == None:
+            status = self.rpc.raw("smartnode",['protocol'])
 
         if status.error:
             msg = "updateProtocolRequirement failed: {}".format(str(status.error))
@@ -452,9 +1222,10 @@ class SmartNodeList(object):
 
         return True
 
-    def updateSyncState(self):
+    def updateSyncState(self, status = None):
 
-        status = self.rpc.getSyncStatus()
+        if status == None:
+            status = self.rpc.getSyncStatus()
 
         if status.error:
             msg = "updateSyncState failed: {}".format(str(status.error))
@@ -472,7 +1243,7 @@ class SmartNodeList(object):
 
         return True
 
-    def updateList(self):
+    def updateList(self, cycle = None):
 
         if not self.chainSynced or not self.nodeListSynced or not self.winnersListSynced:
             logger.error("Not synced! C {}, N {} W {}".format(self.chainSynced, self.nodeListSynced, self.winnersListSynced))
@@ -499,8 +1270,7 @@ class SmartNodeList(object):
         newNodes = []
         removedNodes = []
 
-        info = self.rpc.getInfo()
-        rpcNodes = self.rpc.getSmartNodeList('full')
+        info = cycle.info if cycle else self.rpc.getInfo()
 
         if info.error:
             msg = "updateList getInfo: {}".format(str(info.error))
@@ -512,407 +1282,481 @@ class SmartNodeList(object):
         else:
             self.lastBlock = info.data["blocks"]
 
-        if rpcNodes.error:
-            msg = "updateList getSmartNodeList: {}".format(str(rpcNodes.error))
-            logging.error(msg)
-            self.pushAdmin(msg)
+        rpcNodes = cycle.nodes if cycle else None
+
+        if rpcNodes == None:
+            with self.phases.span('fetchList'):
+                rpcNodes = self.fetchList()
+
+        if rpcNodes == None:
             return False
 
-        rpcNodes = rpcNodes.data
         node = None
 
-        currentList = []
-        self.lastPaidVec = []
+        currentList = set()
         currentTime = int(time.time())
         protocolRequirement = self.protocolRequirement()
 
-        dbCount = self.db.getNodeCount()
+        # Receive the list before locking, a slow response must not block
+        # the list. Only the rows which changed since the last run are kept.
+        with self.phases.span('receive'):
+            rows, complete = self.receiveRows(rpcNodes)
 
-        # Prevent mass deletion of nodes if something is wrong
-        # with the fetched nodelist.
-        if dbCount and len(rpcNodes) and ( dbCount / len(rpcNodes) ) > 1.25:
-            self.pushAdmin("Node count differs too much!")
-            logger.warning("Node count differs too much! - DB {}, CLI {}".format(dbCount,len(rpcNodes)))
-            return False
+        rowCount = len(rows)
+        nodeCount = len(self.nodes)
+
+        # Collects all database changes of this run. They get written
+        # in one transaction once the calculations are done.
+        dirtyNodes = {}
+        # (update, node) tuples for the nodeChangeCB, it gets called once
+        # the list is unlocked.
+        changedNodes = []
 
-        # Prevent reading during the calculations
+        # Time spent for the collateral heights, part of the parse phase
+        collateralTime = 0
+        parseSpan = self.phases.start('parse')
+
+        # Prevent other updates during the calculations. Readers use
+        # the published state and don't get blocked.
         self.acquire()
 
-        # Reset the calculation vars
-        self.qualifiedNormal = 0
+        try:
 
-        for key, data in rpcNodes.items():
+            for key, data, fingerprint in rows:
 
-            collateral = Transaction.fromRaw(key)
+                collateral = self.updateRow(key, data, fingerprint, currentList, newNodes, dirtyNodes, changedNodes)
 
-            currentList.append(collateral)
+                #####
+                ## Check if the collateral height is already detemined
+                ## if not the resolver looks it up in the background and
+                ## it gets assigned in one of the next runs.
+                #####
 
-            if collateral not in self.nodes:
+                if collateral.block <= 0:
 
-                collateral.updateBlock(self.getCollateralAge(collateral.hash))
+                    collateralStart = time.perf_counter()
+                    height = self.collaterals.height(collateral.hash)
 
-                logger.info("Add node {}".format(key))
-                insert = SmartNode.fromRaw(collateral, data)
+                    if height > 0:
+                        node = self.mutableNode(collateral)
+                        node.collateral.updateBlock(height)
+                        self.markDirty(dirtyNodes, collateral, ('collateral_block',))
+                    else:
+                        logger.debug("Collateral block pending {}".format(str(collateral)))
 
-                id = self.db.addNode(collateral,insert)
+                    collateralTime += time.perf_counter() - collateralStart
 
-                if id:
-                    self.nodes[collateral] = insert
-                    newNodes.append(collateral)
+            parseSpan.stop()
 
-                    logger.debug(" => added with collateral {}".format(insert.collateral))
-                else:
-                    logger.error("Could not add the node {}".format(key))
+            pendingCollaterals = self.collaterals.pendingCount()
+            failedCollaterals = self.collaterals.failedCount()
 
-            else:
+            if pendingCollaterals or failedCollaterals:
+                logger.info("Pending collateral lookups {}, failed {}".format(pendingCollaterals, failedCollaterals))
 
-                node = self.nodes[collateral]
-                collateral = node.collateral
-                update = node.update(data)
+            #####
+            ## Remove nodes that are not longer in the global list
+            #####
 
-                if update['status']\
-                or update['protocol']\
-                or update['payee']\
-                or update['lastPaid']\
-                or update['ip']\
-                or update['timeout']:
-                    self.db.updateNode(collateral,node)
+            removalSpan = self.phases.start('removal')
 
-                if sum(map(lambda x: x, update.values())):
+            # Prevent mass deletion of nodes if something is wrong
+            # with the fetched nodelist.
+            if nodeCount and rowCount and ( nodeCount / rowCount ) > 1.25:
+                self.pushAdmin("Node count differs too much!")
+                logger.warning("Node count differs too much! - DB {}, CLI {}".format(nodeCount, rowCount))
+                complete = False
 
-                    if self.nodeChangeCB != None:
-                        self.nodeChangeCB(update, node)
+            nodeCount = len(self.nodes)
 
-            #####
-            ## Check if the collateral height is already detemined
-            ## if not try it!
-            #####
+            if complete and nodeCount > rowCount:
 
-            if collateral.block <= 0:
-                logger.info("Collateral block missing {}".format(str(collateral)))
+                logger.warning("Unequal node count - DB {}, CLI {}".format(nodeCount, rowCount))
 
-                collateral.updateBlock(self.getCollateralAge(collateral.hash))
+                for collateral in [c for c in self.nodes if not c in currentList]:
+                    logger.info("Remove node {}".format(collateral))
+                    removedNodes.append(str(collateral))
+                    removed = self.nodes.pop(collateral)
+                    self.removeIndex(removed)
+                    self.counters.remove(removed.status, removed.protocol)
+                    self.payoutQueue.remove(collateral)
+                    self.volatile.discard(collateral)
 
-                if collateral.block > 0:
-                    self.db.updateNode(collateral,node)
-                else:
-                    logger.warning("Could not fetch collateral block {}".format(str(collateral)))
+                for key in [k for k, v in self.rawRows.items() if v[0] not in currentList]:
+                    self.rawRows.pop(key)
 
-        #####
-        ## Remove nodes from the DB that are not longer in the global list
-        #####
+                if len(removedNodes) != (nodeCount - rowCount):
+                    err = "Remove nodes - something messed up."
+                    self.pushAdmin(err)
+                    logger.error(err)
 
-        dbCount = self.db.getNodeCount()
+            removalSpan.stop()
 
-        if dbCount > len(rpcNodes):
+            positionsSpan = self.phases.start('positions')
 
-            logger.warning("Unequal node count - DB {}, CLI {}".format(dbCount,len(rpcNodes)))
+            #####
+            ## Update vars for calculations
+            #
+            ####
 
-            dbNodes = self.db.getNodes(['collateral'])
+            self.updateCounts()
 
-            for dbNode in dbNodes:
+            logger.debug("Status histogram {}".format(self.counters.statuses))
+            logger.debug("Protocol histogram {}".format(self.counters.protocols))
 
-                collateral = Transaction.fromString(dbNode['collateral'])
+            parameters = self.calculateParameters()
 
-                if not collateral in currentList:
-                    logger.info("Remove node {}".format(dbNode))
-                    removedNodes.append(dbNode['collateral'])
-                    self.db.deleteNode(collateral)
-                    self.nodes.pop(collateral,None)
+            #####
+            ## Update the the position indicator of the node
+            #
+            # CURRENTL MISSING:
+            #   https://github.com/SmartCash/smartcash/blob/1.1.1/src/smartnode/smartnodeman.cpp#L554
+            #####
 
-            if len(removedNodes) != (dbCount - len(rpcNodes)):
-                err = "Remove nodes - something messed up."
-                self.pushAdmin(err)
-                logger.error(err)
+            minimumConfirmations = parameters.minimumConfirmations
+            minimumUptime = parameters.minimumUptime
 
-        logger.info("calculatePositions start")
+            # Qualified nodes without the minimum uptime
+            tooNew = set()
+            # Nodes which are not enabled but match the other requirements
+            notEnabled = []
 
-        #####
-        ## Update vars for calculations
-        #
-        ####
+            for collateral, node in self.nodes.items():
 
-        nodesOld = list(filter(lambda x: x.protocol == self.oldProtocol, self.nodes.values()))
-        nodesNew = list(filter(lambda x: x.protocol == self.newProtocol, self.nodes.values()))
+                # Collaterals with a pending height lookup count as unconfirmed
+                if node.collateral.block <= 0 or\
+                   (self.lastBlock - node.collateral.block) < minimumConfirmations:
+                    self.payoutQueue.remove(collateral)
+                    self.setPosition(collateral, POS_COLLATERAL_AGE)
+                elif node.protocol < protocolRequirement:# https://github.com/SmartCash/Core-Smart/blob/44b5543d0e05be27405bdedcc72b4361cee8129d/src/smartnode/smartnodeman.cpp#L551
+                    self.payoutQueue.remove(collateral)
+                    self.setPosition(collateral, POS_UPDATE_REQUIRED)
+                else:
 
-        self.countOldProtocol = len(nodesOld)
-        self.countNewProtocol = len(nodesNew)
+                    if node.activeSeconds < minimumUptime:# https://github.com/SmartCash/Core-Smart/blob/44b5543d0e05be27405bdedcc72b4361cee8129d/src/smartnode/smartnodeman.cpp#L557
+                        tooNew.add(collateral)
 
-        self.enabledOldProtocol = len(list(filter(lambda x: x.status == "ENABLED", nodesOld)))
-        self.enabledNewProtocol = len(list(filter(lambda x: x.status == "ENABLED", nodesNew)))
+                    if node.status != 'ENABLED': # https://github.com/SmartCash/Core-Smart/blob/44b5543d0e05be27405bdedcc72b4361cee8129d/src/smartnode/smartnodeman.cpp#L548
+                        self.payoutQueue.remove(collateral)
+                        notEnabled.append(collateral)
+                    else:
+                        self.payoutQueue.update(collateral, node.lastPaidBlock)
 
-        self.preEnabled = len(list(filter(lambda x: x.status == "PRE-ENABLED", self.nodes.values())))
-        self.expired = len(list(filter(lambda x: x.status == "EXPIRED", self.nodes.values())))
-        self.newStartRequired = len(list(filter(lambda x: x.status == "NEW-START-REQUIRED", self.nodes.values())))
+            # Without the uptime requirement all nodes in the queue are
+            # qualified (upgrade mode).
+            qualifiedNormal = len(self.payoutQueue) - len(list(filter(lambda x: x in self.payoutQueue, tooNew)))
+            upgradeMode = qualifiedNormal < (parameters.enabledWithMinProtocol / 3)
 
-        #####
-        ## Update the the position indicator of the node
-        #
-        # CURRENTL MISSING:
-        #   https://github.com/SmartCash/smartcash/blob/1.1.1/src/smartnode/smartnodeman.cpp#L554
-        #####
+            if upgradeMode:
+                parameters = parameters._replace(qualifiedUpgrade = qualifiedNormal,
+                                                 qualifiedNormal = len(self.payoutQueue))
+                logger.info("Upgrade mode: {}".format(parameters.qualifiedUpgrade))
+            else:
+                parameters = parameters._replace(qualifiedNormal = qualifiedNormal)
 
-        def calculatePositions(upgradeMode):
+            for collateral in notEnabled:
 
-            self.lastPaidVec = []
+                if not upgradeMode and collateral in tooNew:
+                    self.setPosition(collateral, POS_TOO_NEW)
+                else:
+                    self.setPosition(collateral, POS_NOT_QUALIFIED)
 
-            for collateral, node in self.nodes.items():
+            #####
+            ## Update positions
+            #####
 
-                if (self.lastBlock - node.collateral.block) < self.minimumConfirmations():
-                    node.updatePosition(POS_COLLATERAL_AGE)
-                elif node.protocol < protocolRequirement:# https://github.com/SmartCash/Core-Smart/blob/44b5543d0e05be27405bdedcc72b4361cee8129d/src/smartnode/smartnodeman.cpp#L551
-                    node.updatePosition(POS_UPDATE_REQUIRED)
-                elif not upgradeMode and node.activeSeconds < self.minimumUptime():# https://github.com/SmartCash/Core-Smart/blob/44b5543d0e05be27405bdedcc72b4361cee8129d/src/smartnode/smartnodeman.cpp#L557
-                    node.updatePosition(POS_TOO_NEW)
-                elif node.status != 'ENABLED': # https://github.com/SmartCash/Core-Smart/blob/44b5543d0e05be27405bdedcc72b4361cee8129d/src/smartnode/smartnodeman.cpp#L548
-                    node.updatePosition(POS_NOT_QUALIFIED)
+            value = 0
+            for collateral in self.payoutQueue:
+
+                if not upgradeMode and collateral in tooNew:
+                    self.setPosition(collateral, POS_TOO_NEW)
                 else:
-                    self.lastPaidVec.append(LastPaid(node.lastPaidBlock, collateral))
+                    value +=1
+                    self.setPosition(collateral, value)
 
-            if not upgradeMode and len(self.lastPaidVec) < (self.enabledWithMinProtocol() / 3):
-                self.qualifiedUpgrade = len(self.lastPaidVec)
-                logger.info("Start upgradeMode calculation: {}".format(self.qualifiedUpgrade))
-                calculatePositions(True)
-                return
+            self.updateColumns(len(newNodes) or len(removedNodes))
 
-            if not upgradeMode:
-                self.qualifiedUpgrade = -1
+            positionsSpan.stop()
 
-            self.qualifiedNormal = len(self.lastPaidVec)
+            # Calculated once per run, readers use the published value.
+            if upgradeMode:
+                with self.phases.span('upgrade'):
+                    upgradeModeDuration = self.calculateUpgradeModeDuration(parameters)
+                    parameters = parameters._replace(upgradeModeDuration = upgradeModeDuration)
+                logger.info("calculateUpgradeModeDuration done {}".format("Success" if upgradeModeDuration != None else "Error?"))
 
-        calculatePositions(False)
+            self.parameters = parameters
 
+            # Make the new state available for the readers
+            with self.phases.span('publish'):
+                self.publish()
+                published = self.published
 
-        #####
-        ## Update positions
-        #####
+            #####
+            ## Queue all changes of this run for the database writer. Still
+            ## locked so that stop() drains them.
+            #####
 
-        self.lastPaidVec.sort()
+            with self.phases.span('database'):
+                self.queueChanges(dirtyNodes, removedNodes)
 
-        value = 0
-        for lastPaid in self.lastPaidVec:
-            value +=1
-            self.nodes[lastPaid.transaction].updatePosition(value)
+            # Heights assigned during the parsing and the queuing of new ones
+            saveStart = time.perf_counter()
+            self.collaterals.save(self.writer)
+            self.phases.add('collateral', collateralTime + time.perf_counter() - saveStart)
 
-        logger.info("calculatePositions done")
+            sequence = self.writer.queuedSequence()
 
-        if self.qualifiedUpgrade != -1:
-            logger.info("calculateUpgradeModeDuration start")
-            self.remainingUpgradeModeDuration = self.calculateUpgradeModeDuration()
-            logger.info("calculateUpgradeModeDuration done {}".format("Success" if self.remainingUpgradeModeDuration else "Error?"))
+        finally:
+            self.release()
 
-        self.release()
+        if self.snapshotFile:
+
+            with self.snapshotSem:
+                self.pendingSnapshot = (sequence, published)
+
+            self.saveFlushedSnapshot()
 
         #####
-        ## Invoke the callback if we have new nodes or nodes left
+        ## Invoke the callbacks for changed nodes and if we have new nodes
+        ## or nodes left
         #####
 
-        if len(newNodes) and self.networkCB:
-            self.networkCB(newNodes, True)
+        with self.phases.span('callbacks'):
+
+            if self.nodeChangeCB != None:
+                for update, changed in changedNodes:
+                    self.nodeChangeCB(update, changed)
+
+            if len(newNodes) and self.networkCB:
+                self.networkCB(newNodes, True)
 
-        if len(removedNodes) and self.networkCB:
-            self.networkCB(removedNodes, False)
+            if len(removedNodes) and self.networkCB:
+                self.networkCB(removedNodes, False)
 
         return True
 
-    def updateRanks(self):
+    ######
+    # Receive the rows of the "smartnodelist full" and compare them with the
+    # last run. Returns a list of (key, row, fingerprint) tuples with row None
+    # if it did not change and if the list was received completely.
+    ######
+    def receiveRows(self, rpcNodes):
 
-        if not self.synced():
-            return False
+        rows = []
 
-        ranks = self.rpc.getSmartNodeList('rank')
+        try:
 
-        if ranks.error:
-            msg = "updateRanks getSmartNodeList: {}".format(str(ranks.error))
-            logging.error(msg)
+            for key, data in rpcNodes:
+
+                fingerprint = hash(data)
+                cached = self.rawRows.get(key)
+
+                if cached and cached[1] == fingerprint:
+                    data = None
+
+                rows.append((key, data, fingerprint))
+
+        except RPCStreamError as e:
+            msg = "updateList incomplete nodelist: {}".format(str(e))
+            logger.error(msg)
             self.pushAdmin(msg)
-            return False
+            return rows, False
 
-        for key, data in ranks.items():
+        return rows, True
 
-            rank = data
+    ######
+    # Apply a row of receiveRows() to the list. Rows which did not change
+    # since the last run don't get parsed again. Returns the collateral of
+    # the row.
+    ######
+    def updateRow(self, key, data, fingerprint, currentList, newNodes, dirtyNodes, changedNodes):
 
+        cached = self.rawRows.get(key)
+
+        if cached:
+            collateral = cached[0]
+        else:
             collateral = Transaction.fromRaw(key)
 
-            if collateral not in self.nodes:
-                logger.error("Could not assign rank, node not available {}".format(key))
-            else:
-                self.nodes[collateral].updateRank(data)
+        currentList.add(collateral)
 
-        return True
+        if collateral not in self.nodes:
 
-    def count(self, protocol = -1):
+            logger.info("Add node {}".format(key))
+            insert = SmartNode.fromFields(collateral, data.split())
+
+            self.addNode(insert)
+            self.copied.add(collateral)
+            self.rawRows[key] = (insert.collateral, fingerprint)
+            dirtyNodes[collateral] = None
+            newNodes.append(collateral)
+
+            logger.debug(" => added with collateral {}".format(insert.collateral))
 
-        if protocol == self.oldProtocol:
-            return self.countOldProtocol
-        elif protocol == self.newProtocol:
-            return self.countNewProtocol
         else:
-            return len(self.nodes)
 
-    def protocolRequirement(self):
-        return self.activeProtocol
+            node = self.nodes[collateral]
 
-    def enabledWithMinProtocol(self):
-        if self.protocolRequirement() == self.oldProtocol:
-            return self.enabledOldProtocol + self.enabledNewProtocol
-        elif self.protocolRequirement() == self.newProtocol:
-            return self.enabledNewProtocol
+            # Only parse and compare rows that changed since the last run
+            if cached and cached[1] == fingerprint:
 
-    def minimumRequirementsScale(self):
+                if node.nextTimeout() != node.timeout:
+                    node = self.mutableNode(collateral)
 
-        if self.lastBlock >= HF_1_2_MULTINODE_PAYMENTS and self.lastBlock < HF_1_2_8_COLLATERAL_CHANGE:
-            return 5 # 10/2 => 10 nodes every other block
-        if self.lastBlock >= HF_1_2_8_COLLATERAL_CHANGE:
-            return 0.5 # 1/2 => 1 node every other block
+                update = node.refresh()
+            else:
+                node = self.mutableNode(collateral)
+                ip, payee = node.ip, node.payee
+                status, protocol = node.status, node.protocol
+                seen = (node.lastSeen, node.activeSeconds)
+                update = node.update(data.split())
+                self.rawRows[key] = (node.collateral, fingerprint)
 
-        return 1
+                if seen != (node.lastSeen, node.activeSeconds):
+                    self.volatile.add(collateral)
 
-    def minimumUptime(self):
-        #https://github.com/SmartCash/Core-Smart/blob/44b5543d0e05be27405bdedcc72b4361cee8129d/src/smartnode/smartnodeman.cpp#L557
-        return ( self.enabledWithMinProtocol() * 55 ) / self.minimumRequirementsScale()
+                if update['ip'] or update['payee']:
+                    self.removeIndex(node, ip, payee)
+                    self.addIndex(node)
 
-    def minimumConfirmations(self):
-        #https://github.com/SmartCash/Core-Smart/blob/44b5543d0e05be27405bdedcc72b4361cee8129d/src/smartnode/smartnodeman.cpp#L560
-        return self.enabledWithMinProtocol() / self.minimumRequirementsScale()
+                if update['status'] or update['protocol']:
+                    self.counters.change(status, protocol, node.status, node.protocol)
 
-    def enabled(self, protocol = -1):
+            collateral = node.collateral
 
-        if protocol == self.oldProtocol:
-            return self.enabledOldProtocol
-        elif protocol == self.newProtocol:
-            return self.enabledNewProtocol
-        else:
-            return self.enabledOldProtocol + self.enabledNewProtocol
+            columns = [ column for field, changed in update.items() if changed for column in UPDATE_COLUMNS[field] ]
 
-    def calculateUpgradeModeDuration(self):
+            if len(columns):
+                self.markDirty(dirtyNodes, collateral, columns)
 
-        # Start with an accuracy of 5 nodes.
-        # Will become increased if it takes too long
-        accuracy = 20
-        # Minimum required nodes to continue with normal mode
-        requiredNodes = int(self.enabledWithMinProtocol() / 3)
-        # Get the max active seconds to determine a start point
-        currentCheckTime = max(list(map(lambda x: x.activeSeconds if x.protocol >= self.protocolRequirement() and x.status == 'ENABLED' else 0, self.nodes.values())))
-        logger.debug("Maximum uptime {}".format(currentCheckTime))
-        # Start value
-        step = currentCheckTime * 0.5
-        currentCheckTime -= step
-
-        # Start time for accuracy descrease if needed
-        start = int(time.time())
-        rounds = 1
-
-        calcCount = None
-
-        while accuracy < 1000:
-
-            step *= 0.5
-
-            calcCount = len(list(filter(lambda x: x.protocol == self.protocolRequirement() and\
-                                                  x.status == 'ENABLED' and\
-                                                  (self.lastBlock - x.collateral.block) >= self.minimumConfirmations() and\
-                                                  x.activeSeconds > currentCheckTime, self.nodes.values() )))
-
-            logger.debug("Current count: {}".format(calcCount))
-            logger.debug("Current time: {}".format(currentCheckTime))
-            logger.debug("Current accuracy: {}".format(accuracy))
-            logger.debug("Current accuracy matched: {}\n".format(abs(requiredNodes - calcCount)))
-
-            if int(time.time()) - start >= 2 * rounds:
-                rounds += 1
-                accuracy += 20
-
-            if abs(requiredNodes - calcCount) < accuracy:
-                logger.info("Final accuracy {}".format(accuracy))
-                logger.info("Final accuracy matched {}".format(abs(requiredNodes - calcCount)))
-                logger.info("Remaining duration: {}".format( util.secondsToText((self.minimumUptime() - currentCheckTime))))
-                logger.info("CalcTime: {}, Rounds: {}".format( int(time.time()) - start,rounds))
-                return self.minimumUptime() - currentCheckTime
-            elif calcCount > requiredNodes:
-                currentCheckTime += step
-            else:
-                currentCheckTime -= step
+            if sum(map(lambda x: x, update.values())):
+                changedNodes.append((update, node))
 
-        logger.warning("Could not determine duration?!")
-        logger.warning("Final accuracy {}".format(accuracy))
-        logger.warning("Final accuracy before step out {}".format(abs(requiredNodes - calcCount)))
+        return collateral
 
-        return None
+    ######
+    # Add the changed columns of the node to dirtyNodes, a dict
+    # collateral => set of columns or None for new nodes.
+    ######
+    def markDirty(self, dirtyNodes, collateral, columns):
 
-    def getNodeByIp(self, ip):
+        if collateral in dirtyNodes and dirtyNodes[collateral] == None:
+            return
 
-        if not ':9678' in ip:
-            ip += ":9678"
+        dirtyNodes[collateral] = dirtyNodes.get(collateral, set()) | set(columns)
 
-        filtered = list(filter(lambda x: x.ip == ip, self.nodes.values()))
+    ######
+    # Queue the changes of a cycle for the database writer. The volatile
+    # columns of a node go along with its other changes, the ones of all
+    # other nodes every volatileInterval seconds or if flushVolatile is set.
+    ######
+    def queueChanges(self, dirtyNodes, removedNodes, flushVolatile = False):
 
-        if len(filtered) == 1:
-            return filtered[0]
+        changes = []
 
-        return None
+        for collateral, columns in dirtyNodes.items():
 
-    def getNodesByPayee(self, payee):
-        return list(filter(lambda x: x.payee == payee, self.nodes.values()))
+            if collateral in self.volatile:
 
-    def getNodeCountForProtocol(self, protocol):
-        return self.db.getNodeCount('protocol={}'.format(protocol))
+                if columns != None:
+                    columns = columns | set(VOLATILE_COLUMNS)
 
-    def getNodes(self, collaterals):
+                self.volatile.discard(collateral)
 
-        filtered = []
+            changes.append((self.nodes[collateral], columns))
 
-        for c in collaterals:
+        if flushVolatile or (time.time() - self.lastVolatileFlush) >= self.volatileInterval:
 
-            collateral = None
+            changes += [ (self.nodes[collateral], VOLATILE_COLUMNS) for collateral in self.volatile ]
 
-            if isinstance(c,Transaction):
-                collateral = collateral
-            else:
-                collateral = Transaction.fromString(c)
-                logger.debug("collateral from string ")
+            self.volatile = set()
+            self.lastVolatileFlush = time.time()
 
-            if collateral in self.nodes:
-                filtered.append(self.nodes[collateral])
+        self.writer.updateColumns(changes, removedNodes)
 
-        return filtered
+    ######
+    # Request the nodelist. Returns an iterable of (key, row) tuples or None
+    # if the request failed.
+    ######
+    def fetchList(self, rpc = None):
 
-    def lookup(self, ip):
+        if self.stream:
 
-        result = None
+            try:
+                return self.stream.smartNodeList('full')
+            except RPCStreamError as e:
+                msg = "updateList smartNodeList: {}".format(str(e))
+                logging.error(msg)
+                self.pushAdmin(msg)
+                return None
 
-        node = self.getNodeByIp(ip)
+        rpcNodes = (rpc if rpc else self.rpc).getSmartNodeList('full')
 
-        logger.info("lookup {} - found {}".format(ip, node != None))
+        if rpcNodes.error:
+            msg = "updateList getSmartNodeList: {}".format(str(rpcNodes.error))
+            logging.error(msg)
+            self.pushAdmin(msg)
+            return None
 
-        if node:
+        return rpcNodes.data.items()
 
-            result = {}
+    def updateRanks(self):
 
-            uptimeString = None
+        if not self.synced():
+            return False
 
-            if node.activeSeconds > 0:
-                uptimeString = util.secondsToText(node.activeSeconds)
+        ranks = self.rpc.getSmartNodeList('rank')
+
+        if ranks.error:
+            msg = "updateRanks getSmartNodeList: {}".format(str(ranks.error))
+            logging.error(msg)
+            self.pushAdmin(msg)
+            return False
+
+        for key, data in ranks.items():
+
+            rank = data
+
+            collateral = Transaction.fromRaw(key)
+
+            if collateral not in self.nodes:
+                logger.error("Could not assign rank, node not available {}".format(key))
             else:
-                uptimeString = "No uptime!"
+                self.mutableNode(collateral).updateRank(data)
 
-            result['ip'] = node.cleanIp()
-            result['position'] = node.position < self.enabledWithMinProtocol() * 0.1 and node.position > 0
-            result['position_string'] = node.positionString(self.minimumUptime())
+        return True
 
-            result['status'] = node.status == 'ENABLED'
-            result['status_string'] = "{}".format(node.status)
+    ######
+    # Remaining time until enough nodes match the minimum uptime to leave
+    # the upgrade mode. The mode ends when the uptime of the k-th longest
+    # running eligible node reaches the minimum uptime, with k being the
+    # required number of nodes for the normal mode.
+    ######
+    def calculateUpgradeModeDuration(self, parameters):
 
-            result['uptime'] = node.activeSeconds >= self.minimumUptime()
-            result['uptime_string'] = uptimeString
+        # Minimum required nodes to continue with normal mode
+        requiredNodes = int(parameters.enabledWithMinProtocol / 3)
+        columns = self.columns
 
-            result['protocol'] = node.protocol == self.protocolRequirement()
-            result['protocol_string'] = "{}".format(node.protocol)
+        eligible = columns.combine(columns.equal('protocol', parameters.protocolRequirement),
+                                   columns.statusMask('ENABLED'),
+                                   columns.confirmedMask(self.lastBlock, parameters.minimumConfirmations))
 
-            result['collateral'] = (self.lastBlock - node.collateral.block) >= self.minimumConfirmations()
+        if requiredNodes <= 0:
+            return 0
 
-            result['collateral_string'] = "{}".format((self.lastBlock - node.collateral.block))
+        uptime = columns.kthLargest('activeSeconds', requiredNodes, eligible)
 
-            result['upgrade_mode'] = self.qualifiedUpgrade != -1
+        if uptime == None:
+            logger.warning("Could not determine duration?! Eligible {}, required {}".format(columns.count(eligible), requiredNodes))
+            return None
 
-        return result
+        remaining = max(0, parameters.minimumUptime - uptime)
+
+        logger.info("Remaining duration: {}".format(util.secondsToText(remaining)))
+
+        return remaining
+
+    def getNodeCountForProtocol(self, protocol):
+        return self.counters.protocol(protocol)
@@ -0,0 +1,206 @@
+##
+# Part of `SmartNodeMonitorBot`
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+##
+
+import os
+import sys
+import time
+import zlib
+import struct
+import logging
+
+logger = logging.getLogger("snapshot")
+
+#####
+#
+# Binary snapshot of the nodelist used for a fast start.
+#
+# Layout (little endian):
+#
+#   header   magic, version, header fields, string count, node count
+#   strings  string count x (uint16 length, utf-8 bytes)
+#   nodes    node count x fixed size node record
+#   crc32    of everything before
+#
+# Payees, IPs and status strings are stored once in the string table, the
+# node records refer to them by index. The file gets written to a temporary
+# file first and then moved into place so that a crash never leaves a
+# partially written snapshot behind.
+#
+#####
+
+MAGIC = b'SNLS'
+VERSION = 1
+
+HEADER_FIELDS = ['created',
+                 'lastBlock',
+                 'oldProtocol',
+                 'newProtocol',
+                 'activeProtocol',
+                 'qualifiedNormal',
+                 'qualifiedUpgrade',
+                 'upgradeModeDuration']
+
+NODE_FIELDS = ['hash',
+               'index',
+               'block',
+               'status',
+               'protocol',
+               'payee',
+               'activeSeconds',
+               'lastPaidBlock',
+               'lastPaidTime',
+               'lastSeen',
+               'ip',
+               'timeout',
+               'position']
+
+# Fields of the node records which are stored in the string table
+STRING_FIELDS = [NODE_FIELDS.index('status'),
+                 NODE_FIELDS.index('payee'),
+                 NODE_FIELDS.index('ip')]
+
+headerStruct = struct.Struct('<4sH' + 'q' * len(HEADER_FIELDS) + 'II')
+stringStruct = struct.Struct('<H')
+nodeStruct = struct.Struct('<32sIqIqIqqqqIqq')
+crcStruct = struct.Struct('<I')
+
+class SnapshotError(Exception):
+    pass
+
+class NodeListSnapshot(object):
+
+    def __init__(self, path):
+        self.path = path
+
+    ######
+    # Write the snapshot. header is a dict with the HEADER_FIELDS (None
+    # gets stored as -1), nodes an iterable of tuples in the order of
+    # NODE_FIELDS.
+    ######
+    def write(self, header, nodes):
+
+        start = time.time()
+
+        strings = {}
+        records = []
+
+        for node in nodes:
+
+            node = list(node)
+
+            for field in STRING_FIELDS:
+                node[field] = strings.setdefault(node[field], len(strings))
+
+            records.append(nodeStruct.pack(*node))
+
+        values = [ header.get(x) for x in HEADER_FIELDS ]
+        values = [ -1 if x == None else int(x) for x in values ]
+
+        data = [headerStruct.pack(MAGIC, VERSION, *values, len(strings), len(records))]
+
+        for string in strings:
+            encoded = string.encode('utf-8')
+            data.append(stringStruct.pack(len(encoded)))
+            data.append(encoded)
+
+        data += records
+
+        data = b''.join(data)
+        data += crcStruct.pack(zlib.crc32(data))
+
+        tmpPath = self.path + '.tmp'
+
+        try:
+
+            with open(tmpPath, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+
+            os.replace(tmpPath, self.path)
+
+        except OSError as e:
+            logger.error("Could not write the snapshot {}: {}".format(self.path, e))
+            return False
+
+        logger.info("Snapshot written - {} nodes, {} bytes, {:.3f}s".format(len(records), len(data), time.time() - start))
+
+        return True
+
+    ######
+    # Read the snapshot. Returns (header, nodes) with the header as dict and
+    # the nodes as list of tuples in the order of NODE_FIELDS. Raises
+    # SnapshotError if the file is not a valid snapshot of this version.
+    ######
+    def read(self):
+
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except OSError as e:
+            raise SnapshotError("Could not read {}: {}".format(self.path, e))
+
+        if len(data) < headerStruct.size + crcStruct.size:
+            raise SnapshotError("File too small")
+
+        body = memoryview(data)[:-crcStruct.size]
+
+        if zlib.crc32(body) != crcStruct.unpack_from(data, len(body))[0]:
+            raise SnapshotError("Checksum mismatch")
+
+        values = headerStruct.unpack_from(body)
+
+        if values[0] != MAGIC:
+            raise SnapshotError("Invalid magic")
+
+        if values[1] != VERSION:
+            raise SnapshotError("Unsupported version {}".format(values[1]))
+
+        header = dict(zip(HEADER_FIELDS, values[2:-2]))
+        stringCount, nodeCount = values[-2:]
+
+        offset = headerStruct.size
+        strings = []
+
+        for i in range(stringCount):
+            length = stringStruct.unpack_from(body, offset)[0]
+            offset += stringStruct.size
+            strings.append(sys.intern(str(body[offset:offset + length], 'utf-8')))
+            offset += length
+
+        if len(body) - offset != nodeCount * nodeStruct.size:
+            raise SnapshotError("Invalid node section size")
+
+        nodes = []
+
+        for node in nodeStruct.iter_unpack(body[offset:]):
+
+            node = list(node)
+
+            for field in STRING_FIELDS:
+                node[field] = strings[node[field]]
+
+            nodes.append(node)
+
+        return header, nodes
@@ -0,0 +1,186 @@
+##
+# Part of `SmartNodeMonitorBot`
+#
+# Copyright 2018 dustinface
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+##
+
+import time
+import queue
+import logging
+import sqlite3
+import threading
+
+from src.locking import InstrumentedLock
+from src.metrics import RollingHistogram
+
+logger = logging.getLogger("sqlitepool")
+
+#####
+#
+# SQLite access with one writer and a pool of readers.
+#
+# The database runs in WAL mode so that the readers see the last committed
+# state and don't wait for the writer. The writer is used like the previous
+# single connection:
+#
+#   with pool as db:
+#       db.cursor.execute(...)
+#
+# It commits on exit or rolls back if an exception occurred. Reads take a
+# connection of the pool:
+#
+#   with pool.reader() as db:
+#       db.cursor.execute(...)
+#
+# The writer lock records the wait and hold times per caller, the pool the
+# time spent waiting for a free reader.
+#
+#####
+
+class Reader(object):
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.connection = None
+        self.cursor = None
+
+    def __enter__(self):
+        self.connection = self.pool.takeReader()
+        self.cursor = self.connection.cursor()
+        return self
+
+    def __exit__(self, type, value, traceback):
+
+        self.cursor.close()
+        self.cursor = None
+
+        # End the read transaction, otherwise the reader keeps its snapshot
+        self.connection.rollback()
+
+        self.pool.returnReader(self.connection)
+        self.connection = None
+
+class SQLitePool(object):
+
+    def __init__(self, dburi, readers = 4, cachedStatements = 256, timeout = 30):
+
+        self.dburi = dburi
+        self.readers = readers
+        self.cachedStatements = cachedStatements
+        self.timeout = timeout
+
+        self.writer = self.connect()
+        self.writerLock = InstrumentedLock("sqlite-writer", slowHold = 2)
+        self.cursor = None
+
+        mode = self.writer.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+
+        if mode.lower() != 'wal':
+            logger.warning("Could not enable WAL for {}, mode {}".format(dburi, mode))
+
+        self.writer.execute("PRAGMA synchronous=NORMAL")
+
+        self.sem = threading.Lock()
+        self.pool = queue.Queue()
+        self.created = 0
+
+        self.reads = 0
+        self.readerWaits = 0
+        self.readerWaitTimes = RollingHistogram()
+
+    def connect(self):
+
+        connection = sqlite3.connect(self.dburi,
+                                     timeout=self.timeout,
+                                     check_same_thread=False,
+                                     cached_statements=self.cachedStatements)
+        connection.row_factory = sqlite3.Row
+
+        return connection
+
+    def __enter__(self):
+        self.writerLock.acquire()
+        self.cursor = self.writer.cursor()
+        return self
+
+    def __exit__(self, type, value, traceback):
+
+        try:
+
+            if type == None:
+                self.writer.commit()
+            else:
+                self.writer.rollback()
+
+        finally:
+            self.cursor.close()
+            self.cursor = None
+            self.writerLock.release()
+
+    def reader(self):
+        return Reader(self)
+
+    def takeReader(self):
+
+        try:
+            connection = self.pool.get_nowait()
+        except queue.Empty:
+            connection = None
+
+        if connection == None:
+
+            with self.sem:
+
+                create = self.created < self.readers
+
+                if create:
+                    self.created += 1
+
+            if create:
+                connection = self.connect()
+                connection.execute("PRAGMA query_only=1")
+            else:
+                start = time.perf_counter()
+                connection = self.pool.get()
+
+                with self.sem:
+                    self.readerWaits += 1
+                    self.readerWaitTimes.add(time.perf_counter() - start)
+
+        with self.sem:
+            self.reads += 1
+
+        return connection
+
+    def returnReader(self, connection):
+        self.pool.put(connection)
+
+    def stats(self):
+
+        with self.sem:
+            readers = {'size' : self.readers,
+                       'created' : self.created,
+                       'reads' : self.reads,
+                       'waits' : self.readerWaits,
+                       'wait' : self.readerWaitTimes.stats()}
+
+        return {'readers' : readers,
+                'writer' : self.writerLock.stats()}
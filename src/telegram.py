@@ -37,6 +37,7 @@ from telegram.ext import Updater
 from src import util
 from src import messages
 from src import faq as questions
+from src.scheduler import Scheduler
 
 from src.commandhandler import node
 from src.commandhandler import user
@@ -164,7 +165,8 @@ class MessagingMachine(object):
         self.database = database
         self.queues = {}
         self.sendInterval = 0.25 # Seconds
-        self.timer = None
+        # The sends block, the next run waits sendInterval after the last one
+        self.scheduler = Scheduler("messaging", self.sendInterval, self.run, stallTimeout = 60, fixedDelay = True)
         self.maxLength = 2000
         self.messagesPerSecond = 30
         self.leftover = self.messagesPerSecond
@@ -177,16 +179,13 @@ class MessagingMachine(object):
     # Start the messaging timer
     ######
     def startTimer(self):
-
-        self.timer = threading.Timer(self.sendInterval, self.run)
-        self.timer.start()
+        self.scheduler.start()
 
     ######
     # Stop the messaging timer
     ######
     def stopTimer(self):
-        if self.timer:
-            self.timer.cancel()
+        self.scheduler.stop()
 
     ######
     # Refresh the current rate limit state
@@ -239,6 +238,13 @@ class MessagingMachine(object):
 
         self.sem.acquire()
 
+        try:
+            self.sendMessages()
+        finally:
+            self.sem.release()
+
+    def sendMessages(self):
+
         for chatId, queue in self.queues.items():
 
             if not self.ready():
@@ -295,10 +301,6 @@ class MessagingMachine(object):
 
             self.leftover -= 1
 
-        self.sem.release()
-
-        self.startTimer()
-
 
 class SmartNodeBotTelegram(object):
 
@@ -427,6 +429,10 @@ class SmartNodeBotTelegram(object):
         self.updater.start_polling()
         self.updater.idle()
 
+        # Stopped, write the queued changes
+        self.rewardList.stop()
+        self.nodeList.stop()
+
     def isGroup(self, update):
 
         if update.message.chat_id != update.message.from_user.id:
@@ -512,7 +518,7 @@ class SmartNodeBotTelegram(object):
                 return
 
             collaterals = list(map(lambda x: x['collateral'],userNodes))
-            nodes = self.nodeList.getNodes(collaterals)
+            nodes = self.nodeList.snapshot().getNodes(collaterals)
             check = self.explorer.balances(nodes)
 
             # Needed cause the balanceChecks dict also gets modified from other
@@ -627,6 +633,7 @@ class SmartNodeBotTelegram(object):
             logger.warning("stats - access granted")
 
             response = common.stats(self)
+            response += common.schedulerStats(self, self.messageQueue.scheduler.stats())
 
             self.sendMessage(update.message.chat_id, response)
         else:
@@ -784,11 +791,11 @@ class SmartNodeBotTelegram(object):
         for collateral in collaterals:
 
             # Before chec if a node from anyone got removed and let him know about it.
-            for userNode in self.database.getNodes(collateral):
+            for subscription in self.database.getSubscriptions(collateral):
 
-                response = messages.nodeRemovedNotification(self.messenger, userNode['name'])
+                response = messages.nodeRemovedNotification(self.messenger, subscription.name)
 
-                self.sendMessage(userNode['user_id'], response)
+                self.sendMessage(subscription.userId, response)
 
             # Remove all entries containing this node in the db
             self.database.deleteNodesWithId(collateral)